@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+# Author: Pauli Virtanen <pav@iki.fi>, 2006.
+# All rights reserved. See LICENSE.txt.
+"""
+Benchmark factoring COLNEW's collocation blocks with LINPACK and LAPACK.
+
+Solves linear systems of ``ncomp`` coupled second order equations on a
+fixed mesh, so that the blocks factored in each subinterval have order
+``kd = ncomp * k``, once with LINPACK and once with LAPACK for all
+blocks, and reports the time spent in COLNEW. The smallest ``kd`` from
+which LAPACK is faster is a good value for
+`scikits.bvp1lg.colnew.set_lapack_threshold`.
+
+Usage::
+
+    python benchmarks/lapack_blocks.py [collocation_points] [mesh_size]
+
+"""
+from __future__ import absolute_import, division, print_function
+
+import sys
+import numpy as np
+
+import scikits.bvp1lg.colnew as colnew
+
+
+def coupled_problem(ncomp, seed=1234):
+    """
+    ``u''(x) = -C u(x) + 1``, ``u(0) = u(1) = 0``, with ``C`` dense
+    """
+    c = np.random.RandomState(seed).rand(ncomp, ncomp) / ncomp
+    mstar = 2 * ncomp
+    rows = np.arange(mstar) % ncomp
+
+    def fsub(x, z):
+        return 1 - np.dot(c, z[::2])
+
+    def dfsub(x, z):
+        df = np.zeros([ncomp, mstar, len(x)])
+        df[:,::2,:] = -c[:,:,None]
+        return df
+
+    def gsub(z):
+        return z[2*rows, np.arange(mstar)]
+
+    def dgsub(z):
+        dg = np.zeros([mstar, mstar])
+        dg[np.arange(mstar), 2*rows] = 1
+        return dg
+
+    return dict(boundary_points=[0.0]*ncomp + [1.0]*ncomp,
+                degrees=[2]*ncomp, fsub=fsub, gsub=gsub,
+                dfsub=dfsub, dgsub=dgsub, is_linear=True)
+
+
+def fortran_time(problem, threshold, mesh, k, repeat=5):
+    """Best time spent in COLNEW over `repeat` solves"""
+    old = colnew.set_lapack_threshold(threshold)
+    try:
+        times = []
+        for j in range(repeat):
+            solution = colnew.solve(initial_mesh=mesh,
+                                    adaptive_mesh_selection=False,
+                                    collocation_points=k,
+                                    maximum_mesh_size=2*len(mesh),
+                                    **problem)
+            times.append(solution.stats.fortran_time)
+        return min(times), solution
+    finally:
+        colnew.set_lapack_threshold(old)
+
+
+def main(k=4, mesh_size=200):
+    mesh = np.linspace(0, 1, mesh_size)
+    print("%5s %6s %12s %12s %8s" % ("ncomp", "kd", "LINPACK (s)",
+                                       "LAPACK (s)", "speedup"))
+    crossover = None
+    for ncomp in [1, 2, 3, 4, 5, 6, 8, 12, 16, 24, 32, 48]:
+        problem = coupled_problem(ncomp)
+        t_linpack, sol_linpack = fortran_time(problem, None, mesh, k)
+        t_lapack, sol_lapack = fortran_time(problem, 0, mesh, k)
+        assert np.allclose(sol_linpack(mesh), sol_lapack(mesh),
+                           rtol=1e-8, atol=1e-12)
+
+        kd = ncomp * k
+        speedup = t_linpack / t_lapack
+        print("%5d %6d %12.4g %12.4g %8.2f" % (ncomp, kd, t_linpack,
+                                               t_lapack, speedup))
+        if speedup > 1 and crossover is None:
+            crossover = kd
+        elif speedup <= 1:
+            crossover = None
+
+    if crossover is None:
+        print("\nLINPACK was faster for all block sizes")
+    else:
+        print("\nLAPACK was faster from kd = %d on: consider "
+              "colnew.set_lapack_threshold(%d)" % (crossover, crossover))
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
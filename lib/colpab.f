@@ -0,0 +1,464 @@
+c     Partitioned solution of the almost block diagonal systems of
+c     COLNEW.
+c
+c     COLNEW factors its global system, which is almost block diagonal
+c     with one block of rows per subinterval, with fcblok, and solves
+c     with the factors using sbblok. Both go through the blocks in
+c     order. The routines below instead split the subintervals into
+c     npabd groups, and eliminate the values of z inside each group
+c     independently of the others, in parallel when compiled with
+c     OpenMP. Within a group, z is eliminated one subinterval at a time
+c     with partial pivoting, and the rows not used as pivots carry the
+c     coupling to the first value of z in the group. This leaves an
+c     almost block diagonal system for the values at the ends of the
+c     groups, with one block per group, which is factored and solved
+c     with fcblok and sbblok.
+c
+c     LSYSLV calls pabfac once it has built the global matrix g. This
+c     stores the factors in the arrays given in /colpab/, and replaces
+c     g with the identity, so that the calls of fcblok and sbblok in
+c     COLNEW leave the right-hand side as it is. DMZSOL, which COLNEW
+c     calls right after each sbblok, then solves with pabslv.
+c
+c     /colpab/ holds the addresses and lengths of the real and integer
+c     arrays for the factors, allocated by the caller, and ipabok, set
+c     when they hold the factors of the current g. If npabd is zero or
+c     the arrays are too short, g is left to fcblok and sbblok.
+
+      subroutine pabfac(g, integs, n, mstar, info)
+      use iso_c_binding
+      implicit none
+      integer n, mstar, info, integs(3,*)
+      double precision g(*)
+      integer(c_intptr_t) ipabf, ipabi
+      integer npabd, lpabf, lpabi, ipabok
+      common /colpab/ ipabf, ipabi, npabd, lpabf, lpabi, ipabok
+      double precision, pointer :: f(:)
+      integer, pointer :: ip(:)
+c
+      info = 0
+      ipabok = 0
+      if (npabd .le. 0 .or. ipabf .eq. 0 .or. ipabi .eq. 0
+     1    .or. lpabi .lt. 3) return
+      call c_f_pointer(transfer(ipabf, c_null_ptr), f, [lpabf])
+      call c_f_pointer(transfer(ipabi, c_null_ptr), ip, [lpabi])
+      call pabfc1(g, integs, n, mstar, min(npabd, n), f, lpabf,
+     1            ip, lpabi, info)
+      if (info .eq. 0 .and. ip(1) .gt. 0) ipabok = 1
+      return
+      end
+
+      subroutine pabslv(n, mstar, z)
+      use iso_c_binding
+      implicit none
+      integer n, mstar
+      double precision z(*)
+      integer(c_intptr_t) ipabf, ipabi
+      integer npabd, lpabf, lpabi, ipabok
+      common /colpab/ ipabf, ipabi, npabd, lpabf, lpabi, ipabok
+      double precision, pointer :: f(:)
+      integer, pointer :: ip(:)
+c
+      if (ipabok .ne. 1) return
+      call c_f_pointer(transfer(ipabf, c_null_ptr), f, [lpabf])
+      call c_f_pointer(transfer(ipabi, c_null_ptr), ip, [lpabi])
+      call pabsl1(n, mstar, ip(1), f, ip, z)
+      return
+      end
+
+c     Offsets of the parts of the integer array ip, for n blocks of m
+c     unknowns in np groups:
+c
+c       ip(1)       np, or 0 if the factors are not there
+c       ip(2:3)     offsets in the real array of the reduced system and
+c                   of the scratch space of fcblok
+c       ip(iblk)    blk(5,n): for block j, its number of rows, number of
+c                   rows reserved by fcblok for the previous block,
+c                   rows in the elimination of z(j), offset of its
+c                   factors in the real array, and offset in g
+c       ip(ipiv)    piv(m,n): pivots of the eliminations
+c       ip(igrp)    grp(5,np): for each group, its first and last
+c                   blocks, rows carried to the reduced system, rows
+c                   reserved by fcblok, and offset of its block of the
+c                   reduced system in the real array
+c       ip(irint)   integs of the reduced system, as for fcblok
+c       ip(irpiv)   pivots of the reduced system
+c
+      subroutine pabofs(n, m, np, iblk, ipiv, igrp, irint, irpiv, li)
+      implicit none
+      integer n, m, np, iblk, ipiv, igrp, irint, irpiv, li
+c
+      iblk = 4
+      ipiv = iblk + 5*n
+      igrp = ipiv + m*n
+      irint = igrp + 5*np
+      irpiv = irint + 3*np
+      li = irpiv + (np+1)*m - 1
+      return
+      end
+
+      subroutine pabfc1(g, integs, n, m, np, f, lf, ip, li, info)
+      implicit none
+      integer n, m, np, lf, li, info, integs(3,*), ip(*)
+      double precision g(*), f(*)
+      integer iblk, ipiv, igrp, irint, irpiv, lneed, p, nthrs, ising,
+     1        inf
+      integer nthr
+      common /colthr/ nthr
+c$    integer omp_get_max_threads
+c
+      ip(1) = 0
+      call pabofs(n, m, np, iblk, ipiv, igrp, irint, irpiv, lneed)
+      if (lneed .gt. li) return
+      call pablay(integs, n, m, np, ip(iblk), ip(igrp), ip(irint),
+     1            ip(2), ip(3), lneed)
+      if (lneed .gt. lf) return
+c
+c...  eliminate within the groups
+c
+      nthrs = 1
+c$    nthrs = nthr
+c$    if (nthrs .le. 0) nthrs = omp_get_max_threads()
+      ising = 0
+c$omp parallel do if (nthrs .gt. 1 .and. np .gt. 1)
+c$omp&   num_threads (max(nthrs, 1)) schedule (static, 1)
+c$omp&   private (inf) reduction (max: ising)
+      do 10 p = 1, np
+         call pabgrp(g, m, ip(iblk), ip(ipiv), ip(igrp+5*(p-1)), f, inf)
+         ising = max(ising, inf)
+   10 continue
+      info = ising
+      if (info .ne. 0) return
+c
+c...  factor the reduced system
+c
+      call fcblok(f(ip(2)), ip(irint), np, ip(irpiv), f(ip(3)), inf)
+      if (inf .ne. 0) then
+         info = 1
+         return
+      endif
+      ip(1) = np
+      return
+      end
+
+c     Layout of the factors: see pabofs. lneed is set to the length of
+c     the real array needed.
+c
+      subroutine pablay(integs, n, m, np, blk, grp, rint, goff, soff,
+     1                  lneed)
+      implicit none
+      integer n, m, np, integs(3,*), blk(5,*), grp(5,*), rint(3,*),
+     1        goff, soff, lneed
+      integer c, ig, j, p, b, e, r, off, nrowr, ls
+c
+c...  fcblok reserves the rows below the pivots of a block at the top
+c...  of the next
+      c = 0
+      ig = 1
+      do 10 j = 1, n
+         blk(1,j) = integs(1,j)
+         blk(2,j) = c
+         blk(5,j) = ig
+         c = integs(1,j) - m
+         ig = ig + integs(1,j)*integs(2,j)
+   10 continue
+c
+      off = 1
+      c = 0
+      do 30 p = 1, np
+         b = 1 + ((p-1)*n)/np
+         e = (p*n)/np
+         grp(1,p) = b
+         grp(2,p) = e
+         r = blk(1,b) - blk(2,b)
+         blk(3,b) = 0
+         blk(4,b) = 0
+         do 20 j = b+1, e
+            blk(3,j) = r + blk(1,j) - blk(2,j)
+            blk(4,j) = off
+            off = off + blk(3,j)*m + 2*m*m
+            r = blk(3,j) - m
+   20    continue
+         nrowr = c + r
+         grp(3,p) = r
+         grp(4,p) = c
+         rint(1,p) = nrowr
+         rint(2,p) = 2*m
+         rint(3,p) = m
+         c = nrowr - m
+   30 continue
+      rint(3,np) = 2*m
+c
+      goff = off
+      ls = 0
+      do 40 p = 1, np
+         grp(5,p) = off
+         off = off + rint(1,p)*2*m
+         ls = max(ls, rint(1,p))
+   40 continue
+      soff = off
+      lneed = soff + ls - 1
+      return
+      end
+
+c     Elimination within one group. The rows carried forward have
+c     columns cf for the first z of the group, and ch for the next one
+c     to eliminate. The elimination of z(j) works on the matrix ab of
+c     the carried rows and the rows of block j, with columns for z(j),
+c     the first z, and z(j+1).
+c
+      subroutine pabgrp(g, m, blk, piv, grp, f, info)
+      implicit none
+      integer m, blk(5,*), piv(m,*), grp(5), info
+      double precision g(*), f(*)
+      double precision, allocatable :: cf(:,:), ch(:,:), ab(:,:)
+      integer b, e, j, r, q, c, nrow, ig, mj, k, l, i, jc, lab, off, nr
+      integer idamax
+      external idamax
+c
+      info = 0
+      b = grp(1)
+      e = grp(2)
+      lab = 3*m
+      allocate(cf(2*m,m), ch(2*m,m), ab(lab,3*m))
+c
+c...  the rows of the first block start the rows carried forward
+      ig = blk(5,b)
+      nrow = blk(1,b)
+      c = blk(2,b)
+      r = nrow - c
+      do 20 jc = 1, m
+         do 10 i = 1, r
+            cf(i,jc) = g(ig + c + i - 1 + (jc-1)*nrow)
+            ch(i,jc) = g(ig + c + i - 1 + (m+jc-1)*nrow)
+   10    continue
+   20 continue
+      call pabone(g(ig), nrow, c, m)
+c
+      do 100 j = b+1, e
+         ig = blk(5,j)
+         nrow = blk(1,j)
+         c = blk(2,j)
+         q = nrow - c
+         mj = blk(3,j)
+         do 40 jc = 1, m
+            do 30 i = 1, r
+               ab(i,jc) = ch(i,jc)
+               ab(i,m+jc) = cf(i,jc)
+               ab(i,2*m+jc) = 0.0d0
+   30       continue
+            do 35 i = 1, q
+               ab(r+i,jc) = g(ig + c + i - 1 + (jc-1)*nrow)
+               ab(r+i,m+jc) = 0.0d0
+               ab(r+i,2*m+jc) = g(ig + c + i - 1 + (m+jc-1)*nrow)
+   35       continue
+   40    continue
+         call pabone(g(ig), nrow, c, m)
+c
+c...     eliminate z(j), storing the negated multipliers
+         do 50 k = 1, m
+            l = k - 1 + idamax(mj-k+1, ab(k,k), 1)
+            piv(k,j) = l
+            if (ab(l,k) .eq. 0.0d0) then
+               info = 1
+               goto 200
+            endif
+            if (l .ne. k) then
+               call dswap(3*m-k+1, ab(k,k), lab, ab(l,k), lab)
+            endif
+            call dscal(mj-k, -1.0d0/ab(k,k), ab(k+1,k), 1)
+            call dger(mj-k, 3*m-k, 1.0d0, ab(k+1,k), 1, ab(k,k+1), lab,
+     1                ab(k+1,k+1), lab)
+   50    continue
+c
+c...     keep the factors of the z(j) columns, and the rows of the
+c...     pivots in the other columns
+         off = blk(4,j)
+         do 70 jc = 1, m
+            do 60 i = 1, mj
+               f(off + i - 1 + (jc-1)*mj) = ab(i,jc)
+   60       continue
+   70    continue
+         off = off + mj*m
+         do 80 jc = 1, 2*m
+            do 75 i = 1, m
+               f(off + i - 1 + (jc-1)*m) = ab(i,m+jc)
+   75       continue
+   80    continue
+c
+c...     the rest are carried forward
+         r = mj - m
+         do 90 jc = 1, m
+            do 85 i = 1, r
+               cf(i,jc) = ab(m+i,m+jc)
+               ch(i,jc) = ab(m+i,2*m+jc)
+   85       continue
+   90    continue
+  100 continue
+c
+c...  the carried rows are the rows of the group in the reduced system
+      nr = grp(4) + r
+      off = grp(5)
+      do 120 jc = 1, m
+         do 110 i = 1, grp(4)
+            f(off + i - 1 + (jc-1)*nr) = 0.0d0
+            f(off + i - 1 + (m+jc-1)*nr) = 0.0d0
+  110    continue
+         do 115 i = 1, r
+            f(off + grp(4) + i - 1 + (jc-1)*nr) = cf(i,jc)
+            f(off + grp(4) + i - 1 + (m+jc-1)*nr) = ch(i,jc)
+  115    continue
+  120 continue
+c
+  200 deallocate(cf, ch, ab)
+      return
+      end
+
+c     Replace a block of g by the rows of the identity, for which fcblok
+c     and sbblok change nothing.
+c
+      subroutine pabone(gi, nrow, c, m)
+      implicit none
+      integer nrow, c, m
+      double precision gi(nrow,*)
+      integer i, jc
+c
+      do 20 jc = 1, 2*m
+         do 10 i = 1, nrow
+            gi(i,jc) = 0.0d0
+   10    continue
+   20 continue
+      do 30 i = c+1, nrow
+         gi(i,i) = 1.0d0
+   30 continue
+      return
+      end
+
+c     Solve with the factors from pabfac: the right-hand side z, with
+c     the rows of block j at (j-1)*m+1, is overwritten by the solution,
+c     with z(j) at the same place.
+c
+      subroutine pabsl1(n, m, np, f, ip, z)
+      implicit none
+      integer n, m, np, ip(*)
+      double precision f(*), z(*)
+      double precision, allocatable :: w(:), xr(:)
+      integer iblk, ipiv, igrp, irint, irpiv, li, p, nthrs
+      integer nthr
+      common /colthr/ nthr
+c$    integer omp_get_max_threads
+c
+      call pabofs(n, m, np, iblk, ipiv, igrp, irint, irpiv, li)
+      allocate(w(m*n), xr((np+1)*m))
+      nthrs = 1
+c$    nthrs = nthr
+c$    if (nthrs .le. 0) nthrs = omp_get_max_threads()
+c
+c...  forward within the groups, giving the reduced right-hand side
+c$omp parallel do if (nthrs .gt. 1 .and. np .gt. 1)
+c$omp&   num_threads (max(nthrs, 1)) schedule (static, 1)
+      do 10 p = 1, np
+         call pabfwd(m, p, ip(iblk), ip(ipiv), ip(igrp+5*(p-1)), f, z,
+     1               w, xr)
+   10 continue
+c
+      call sbblok(f(ip(2)), ip(irint), np, ip(irpiv), xr)
+c
+c...  back within the groups, from the values at their ends
+c$omp parallel do if (nthrs .gt. 1 .and. np .gt. 1)
+c$omp&   num_threads (max(nthrs, 1)) schedule (static, 1)
+      do 20 p = 1, np
+         call pabbak(n, m, np, p, ip(iblk), ip(igrp+5*(p-1)), f, w, xr,
+     1               z)
+   20 continue
+      deallocate(w, xr)
+      return
+      end
+
+      subroutine pabfwd(m, p, blk, piv, grp, f, z, w, xr)
+      implicit none
+      integer m, p, blk(5,*), piv(m,*), grp(5)
+      double precision f(*), z(*), w(m,*), xr(*)
+      double precision, allocatable :: u(:)
+      double precision t
+      integer b, e, j, r, c, mj, k, l, i, off
+c
+      b = grp(1)
+      e = grp(2)
+      allocate(u(3*m))
+      c = blk(2,b)
+      r = blk(1,b) - c
+      do 10 i = 1, r
+         u(i) = z((b-1)*m + c + i)
+   10 continue
+      do 50 j = b+1, e
+         c = blk(2,j)
+         mj = blk(3,j)
+         do 20 i = r+1, mj
+            u(i) = z((j-1)*m + c + i - r)
+   20    continue
+         off = blk(4,j)
+         do 30 k = 1, m
+            l = piv(k,j)
+            t = u(l)
+            if (l .ne. k) then
+               u(l) = u(k)
+               u(k) = t
+            endif
+            call daxpy(mj-k, t, f(off + k + (k-1)*mj), 1, u(k+1), 1)
+   30    continue
+         do 40 i = 1, m
+            w(i,j) = u(i)
+   40    continue
+         r = mj - m
+         do 45 i = 1, r
+            u(i) = u(m+i)
+   45    continue
+   50 continue
+      do 60 i = 1, r
+         xr((p-1)*m + grp(4) + i) = u(i)
+   60 continue
+      deallocate(u)
+      return
+      end
+
+      subroutine pabbak(n, m, np, p, blk, grp, f, w, xr, z)
+      implicit none
+      integer n, m, np, p, blk(5,*), grp(5)
+      double precision f(*), w(m,*), xr(*), z(*)
+      double precision, allocatable :: u(:), v(:)
+      integer b, e, j, mj, i, off
+c
+      b = grp(1)
+      e = grp(2)
+      allocate(u(m), v(m))
+      do 10 i = 1, m
+         z((b-1)*m + i) = xr((p-1)*m + i)
+         v(i) = xr(p*m + i)
+   10 continue
+      if (p .eq. np) then
+         do 20 i = 1, m
+            z(n*m + i) = xr(np*m + i)
+   20    continue
+      endif
+c
+c...  v is z(j+1), and z(b) the first z of the group
+      do 50 j = e, b+1, -1
+         mj = blk(3,j)
+         off = blk(4,j)
+         do 30 i = 1, m
+            u(i) = w(i,j)
+   30    continue
+         call dgemv('N', m, m, -1.0d0, f(off + mj*m), m,
+     1              xr((p-1)*m + 1), 1, 1.0d0, u, 1)
+         call dgemv('N', m, m, -1.0d0, f(off + mj*m + m*m), m,
+     1              v, 1, 1.0d0, u, 1)
+         call dtrsv('U', 'N', 'N', m, f(off), mj, u, 1)
+         do 40 i = 1, m
+            z((j-1)*m + i) = u(i)
+            v(i) = u(i)
+   40    continue
+   50 continue
+      deallocate(u, v)
+      return
+      end
@@ -16,6 +16,10 @@ Contents
   also with unseparated boundary conditions. Uses a multiple shooting
   method.
 
+- `continuation`:
+  Follows solutions of parameter-dependent problems computed with
+  `colnew`, with adaptive pseudo-arclength continuation.
+
 - `jacobian`:
   Utility routines, for checking functions that calculate Jacobians,
   or just calculating them.
@@ -34,6 +38,7 @@ except ImportError:
 from .error import *
 from . import colnew
 from . import mus
+from . import continuation
 from . import jacobian
 from . import examples
 
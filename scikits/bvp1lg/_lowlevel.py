@@ -0,0 +1,81 @@
+# Author: Pauli Virtanen <pav@iki.fi>, 2006.
+# All rights reserved. See LICENSE.txt.
+"""
+Compiled callback functions.
+
+f2py calls a callback given as a PyCapsule with no name directly through
+the function pointer in it, with the Fortran argument list, so that the
+interpreter is not involved. `capsule` converts the usual ways of
+passing compiled functions to such capsules.
+
+"""
+from __future__ import absolute_import, division, print_function
+
+import ctypes
+
+_PyCapsule_New = ctypes.pythonapi.PyCapsule_New
+_PyCapsule_New.restype = ctypes.py_object
+_PyCapsule_New.argtypes = [ctypes.c_void_p, ctypes.c_char_p, ctypes.c_void_p]
+
+_PyCapsule_GetName = ctypes.pythonapi.PyCapsule_GetName
+_PyCapsule_GetName.restype = ctypes.c_char_p
+_PyCapsule_GetName.argtypes = [ctypes.py_object]
+
+_PyCapsule_GetPointer = ctypes.pythonapi.PyCapsule_GetPointer
+_PyCapsule_GetPointer.restype = ctypes.c_void_p
+_PyCapsule_GetPointer.argtypes = [ctypes.py_object, ctypes.c_char_p]
+
+def _address(func):
+    """Address of a compiled function, or None for other objects"""
+    if type(func).__name__ == 'LowLevelCallable':
+        # scipy.LowLevelCallable
+        if func.user_data is not None:
+            raise ValueError("LowLevelCallable with user data is not "
+                             "supported")
+        func = func.function
+
+    if isinstance(func, ctypes._CFuncPtr):
+        return ctypes.cast(func, ctypes.c_void_p).value
+
+    if type(func).__name__ == 'PyCapsule':
+        return _PyCapsule_GetPointer(func, _PyCapsule_GetName(func))
+
+    if type(func).__module__ == '_cffi_backend':
+        ## Postponed import -- soft dependency on cffi only
+        import cffi
+        ffi = cffi.FFI()
+        if ffi.typeof(func).kind == 'function':
+            # a function, as opposed to a pointer to it
+            func = ffi.addressof(func)
+        return int(ffi.cast('uintptr_t', func))
+
+    return None
+
+def capsule(func):
+    """
+    Convert a compiled function to a callback for the Fortran routines.
+
+    Parameters
+    ----------
+    func
+        A `ctypes` function pointer, a `cffi` function or function
+        pointer, a PyCapsule, or a `scipy.LowLevelCallable` made of
+        these.
+
+    Returns
+    -------
+    capsule : PyCapsule or None
+        Nameless capsule containing the function pointer, or None if
+        `func` is not a compiled function.
+
+    Notes
+    -----
+    The capsule does not keep `func` alive; the caller must.
+
+    """
+    address = _address(func)
+    if address is None:
+        return None
+    if not address:
+        raise ValueError("NULL function pointer")
+    return _PyCapsule_New(address, None, None)
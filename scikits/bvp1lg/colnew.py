@@ -7,8 +7,16 @@ colnew
 Solve multi-point boundary value problems for ODEs
 
 - `solve`: Solve linear and non-linear problems
+- `solve_many`: Solve a family of problems in parallel processes
+- `Problem`, `prepare`: Prepare a problem once for solving it repeatedly
+- `Factorization`: Linear problem factored once, for many right-hand sides
 - `Solution`: Returned by `solve` to represent the solution
+- `SolveStats`: Statistics of a solve, in `Solution.stats`
+- `IterationInfo`, `MeshInfo`: Progress records passed to hooks of `solve`
+- `save_solutions`, `load_solutions`: Store solutions in binary archives
 - `check_jacobians`: Check ``dfsub`` and ``dgsub`` for correctness
+- `set_workspace_pool_size`: Control reuse of workspace between solves
+- `set_lapack_threshold`: Choose between LINPACK and LAPACK for the blocks
 
 .. seealso:: `scikits.bvp1lg.examples`
 
@@ -76,11 +84,23 @@ Module contents
 """
 from __future__ import absolute_import, division, print_function
 
+import os
+import shutil
+import atexit
+import tempfile
+import threading
+import importlib.util
+import multiprocessing
+import multiprocessing.pool
+import collections
+from math import factorial
+from timeit import default_timer as _timer
 import numpy as np
 from . import _colnew
 from . import jacobian as _jacobian
 from . import error as _error
 from . import complex_adapter as _complex_adapter
+from . import _lowlevel
 
 ## Solution
 
@@ -97,10 +117,30 @@ class Solution(object):
         """The ISPACE vector provided by COLNEW"""
         self.fspace = fspace[:ispace[6]].copy()
         """The FSPACE vector provided by COLNEW"""
+        self.stats = None
+        """`SolveStats` of the solve giving this solution, if any"""
 
-    def __call__(self, x):
+    def __call__(self, x, components=None, out=None, chunk_size=None,
+                 threads=None):
         """Evaluate the solution at given points.
 
+        Parameters
+        ----------
+        x : array_like
+            Points where to evaluate.
+        components : sequence of int, optional
+            Indices of the z-components to compute. Default is all.
+        out : ndarray, optional
+            C-contiguous float array, for example a `numpy.memmap`,
+            of shape ``x.shape + (len(components),)`` where to write
+            the result.
+        chunk_size : int, optional
+            Evaluate at most this many points at a time, to limit the
+            size of temporary arrays. Default is 65536 if `components`
+            or `out` is given, otherwise all points at once.
+        threads : int, optional
+            Number of threads to evaluate the chunks on. Default is 1.
+
         Returns
         -------
         sol : ndarray
@@ -110,12 +150,111 @@ class Solution(object):
                  u_{ncomp}^{m_{ncomp} - 1}]
 
             broadcast to ``x``. Shape of the returned array
-            is x.shape + (mstar,).
+            is x.shape + (mstar,). If `components` is given, only
+            the requested components, in the given order.
+
+        Notes
+        -----
+        The GIL is released during the evaluation, so several threads
+        can evaluate solutions concurrently. The points may be given
+        in any order; each is located on the mesh by bisection. Points
+        outside the mesh are moved to its ends.
         """
         x = np.asarray(x)
-        y = _colnew.appsln_many(x.flat, self.fspace, self.ispace).T
-        y.shape = x.shape + (self.mstar,)
-        return y
+        if threads is None:
+            threads = 1
+        elif threads < 1:
+            raise ValueError("threads must be positive")
+        if (components is None and out is None and chunk_size is None
+                and threads == 1):
+            y = _colnew.appsln_many(x.flat, self.fspace, self.ispace).T
+            y.shape = x.shape + (self.mstar,)
+            return y
+
+        if components is not None:
+            components = np.asarray(components, np.intp).ravel()
+            ncols = len(components)
+        else:
+            ncols = int(self.mstar)
+
+        shape = x.shape + (ncols,)
+        if out is None:
+            out = np.empty(shape, np.float64)
+        elif (out.shape != shape or out.dtype != np.float64
+              or not out.flags.c_contiguous):
+            raise ValueError("out must be a C-contiguous float array "
+                             "of shape %r" % (shape,))
+        x_flat = x.reshape(-1)
+        out_flat = out.reshape(-1, ncols)
+        if chunk_size is None:
+            chunk_size = min(65536, -(-len(x_flat) // threads))
+        elif chunk_size < 1:
+            raise ValueError("chunk_size must be positive")
+
+        def evaluate(start):
+            xc = x_flat[start:start+chunk_size]
+            yc = out_flat[start:start+chunk_size]
+            if components is None:
+                yc[...] = _colnew.appsln_many(xc, self.fspace,
+                                              self.ispace).T
+            else:
+                self._evaluate_components(xc, components, yc)
+
+        starts = range(0, len(x_flat), max(chunk_size, 1))
+        if threads == 1 or len(starts) <= 1:
+            for start in starts:
+                evaluate(start)
+        else:
+            pool = multiprocessing.pool.ThreadPool(min(threads, len(starts)))
+            try:
+                pool.map(evaluate, starts)
+            finally:
+                pool.close()
+        return out
+
+    def _evaluate_components(self, x, components, out):
+        """Evaluate selected components with Horner's rule"""
+        c = self._get_coefficients()
+        mesh = self.mesh
+        x = np.clip(x, mesh[0], mesh[-1])
+        i = np.clip(np.searchsorted(mesh, x, side='right') - 1,
+                    0, len(mesh) - 2)[:,None]
+        t = (x - mesh[i[:,0]])[:,None]
+        out[...] = c[0][i, components]
+        for p in range(1, c.shape[0]):
+            out *= t
+            out += c[p][i, components]
+
+    def __reduce__(self):
+        # Pickle only the COLNEW data, not the cached coefficients
+        return (Solution, (self.ispace, self.fspace))
+
+    def save(self, filename):
+        """Save the solution to a file
+
+        See `save_solutions`.
+        """
+        save_solutions(filename, [self])
+
+    @staticmethod
+    def load(filename, index=0, mmap=True):
+        """Load a solution saved with `save` or `save_solutions`
+
+        See `load_solutions`.
+        """
+        return load_solutions(filename, [index], mmap=mmap)[0]
+
+    @classmethod
+    def _from_arrays(cls, ispace, fspace):
+        """Create a solution using the given arrays without copying"""
+        self = cls.__new__(cls)
+        self.ncomp = ispace[2]
+        self.mstar = ispace[3]
+        self.nmesh = ispace[0] + 1
+        self.ispace = ispace
+        self.fspace = fspace
+        self.stats = None
+        return self
 
     def get_mesh(self):
         """Get the mesh points on which the solution is specified
@@ -139,6 +278,313 @@ class Solution(object):
         """
         return self(self.mesh)
 
+    def to_ppoly(self):
+        """Convert the solution to a piecewise polynomial
+
+        Returns
+        -------
+        ppoly : scipy.interpolate.PPoly
+            Piecewise polynomial on the mesh, equal to the solution.
+            ``ppoly(x)`` has the same shape as ``self(x)``.
+        """
+        ## Postponed import -- soft dependency on Scipy only
+        import scipy.interpolate as _interpolate
+
+        return _interpolate.PPoly(self._get_coefficients(), self.mesh.copy())
+
+    def _get_coefficients(self):
+        """Get the polynomial coefficients of the solution on each subinterval
+
+        Returns
+        -------
+        c : ndarray, shape (mmax + k, nmesh - 1, mstar)
+            ``c[p, i, j]`` is the coefficient of
+            ``(x - mesh[i])**(mmax + k - 1 - p)`` in z_j(x) on the i-th
+            subinterval, as in `scipy.interpolate.PPoly`.
+        """
+        try:
+            return self._coefficients
+        except AttributeError:
+            pass
+
+        mesh, z, dmz, coef = _unpack(self.ispace, self.fspace)
+        degrees = [int(m) for m in self.ispace[7:]]
+        n, k, ncomp = dmz.shape
+        order = max(degrees) + k
+
+        # u_j^{(m_j)}(x) = sum_p b[i,p,j] (x - mesh[i])**p / p!
+        h = np.diff(mesh)
+        b = np.tensordot(dmz, coef[:,::-1], axes=([1], [0])).transpose(0, 2, 1)
+        b /= h[:,None,None] ** np.arange(k)[None,:,None]
+
+        # z_{j,d} is the Taylor polynomial of u_j^{(d)} at mesh[i], plus
+        # the (m_j - d)-fold integral of u_j^{(m_j)}
+        c = np.zeros([order, n, int(self.mstar)])
+        j = 0
+        for i, m in enumerate(degrees):
+            for d in range(m):
+                for q in range(m - d):
+                    c[order-1-q,:,j] = z[:n,j+q] / factorial(q)
+                for p in range(k):
+                    c[order-1-p-(m-d),:,j] = b[:,p,i] / factorial(p + m - d)
+                j += 1
+
+        self._coefficients = c
+        return c
+
+    def evaluation_operator(self, x):
+        """Get a linear operator evaluating solutions at given points
+
+        Parameters
+        ----------
+        x : array_like
+            Points where to evaluate.
+
+        Returns
+        -------
+        op : scipy.sparse.csr_matrix, shape (x.size * mstar, len(fspace))
+            Sparse matrix such that::
+
+                (op * self.fspace).reshape(x.shape + (mstar,)) == self(x)
+
+            It applies also to the `fspace` of any other solution with
+            the same mesh, number of collocation points, and degrees.
+
+        Notes
+        -----
+        The operators are cached, so that repeated sampling of solutions
+        on the same mesh at the same points costs a sparse matrix-vector
+        product.
+        """
+        x = np.asarray(x, np.float64)
+        degrees = tuple(int(m) for m in self.ispace[7:])
+        key = (self.mesh.tobytes(), int(self.ispace[1]), degrees,
+               x.shape, x.tobytes())
+        op = _operator_cache.get(key)
+        if op is None:
+            op = _evaluation_operator(self.ispace, self.fspace, x.ravel())
+            _operator_cache.put(key, op)
+        return op
+
+def _unpack(ispace, fspace):
+    """
+    Split the COLNEW output to parts.
+
+    Returns
+    -------
+    mesh : ndarray, shape (n + 1,)
+        The mesh
+    z : ndarray, shape (n + 1, mstar)
+        z-vectors at the mesh points
+    dmz : ndarray, shape (n, k, ncomp)
+        m_i-th derivatives of u_i at the collocation points
+    coef : ndarray, shape (k, k)
+        ``coef[l, k - 1 - p] / p!`` is the coefficient of ``s**p`` in the
+        Lagrange polynomial of the l-th collocation point, where ``s`` is the
+        position on the subinterval, scaled to [0, 1]. COLNEW stores the
+        powers in descending order.
+    """
+    n, k, ncomp, mstar = [int(v) for v in ispace[:4]]
+    iz = n + 1
+    idmz = iz + mstar * (n + 1)
+    icoef = int(ispace[5]) - 1
+    return (fspace[:iz],
+            fspace[iz:idmz].reshape(n + 1, mstar),
+            fspace[idmz:idmz + n*k*ncomp].reshape(n, k, ncomp),
+            fspace[icoef:icoef + k*k].reshape(k, k))
+
+def _pack(mesh, z, dmz, coef, degrees):
+    """
+    Form the COLNEW output from the parts returned by `_unpack`.
+    """
+    n, k, ncomp = dmz.shape
+    mstar = z.shape[1]
+    fspace = np.concatenate([mesh, z.ravel(), dmz.ravel(), coef.ravel()])
+    is6 = n + 2 + mstar * (n + 1) + k * ncomp * n
+    ispace = np.array([n, k, ncomp, mstar, max(degrees), is6, is6 + k*k - 1]
+                      + list(degrees), np.int32)
+    return ispace, fspace
+
+def _evaluation_operator(ispace, fspace, x):
+    """
+    Form the sparse matrix evaluating the solution at the points `x`.
+
+    See `Solution.evaluation_operator`.
+    """
+    ## Postponed import -- soft dependency on Scipy only
+    import scipy.sparse as _sparse
+
+    n, k, ncomp, mstar = [int(v) for v in ispace[:4]]
+    degrees = [int(m) for m in ispace[7:]]
+    mesh, z, dmz, coef = _unpack(ispace, fspace)
+    iz = n + 1
+    idmz = iz + mstar * (n + 1)
+
+    # Subinterval of each point; points outside the mesh are moved
+    # to its ends, as in APPROX
+    x = np.clip(x, mesh[0], mesh[-1])
+    i = np.clip(np.searchsorted(mesh, x, side='right') - 1, 0, n - 1)
+    t = x - mesh[i]
+    s = t / (mesh[i + 1] - mesh[i])
+    rows = np.arange(len(x)) * mstar
+
+    row_parts, col_parts, data_parts = [], [], []
+    def add(r, c, v):
+        row_parts.append(r)
+        col_parts.append(c)
+        data_parts.append(v)
+
+    # z_{j,d}(x) = sum_q z_{j+q}(mesh[i]) t**q / q!
+    #              + t**(m-d) sum_{l,p} dmz[i,l] coef[l,k-1-p] s**p / (p+m-d)!
+    j = 0
+    for comp, m in enumerate(degrees):
+        for d in range(m):
+            for q in range(m - d):
+                add(rows + j, iz + i*mstar + j + q, t**q / factorial(q))
+            for l in range(k):
+                w = sum(coef[l,k-1-p] * s**p / factorial(p + m - d)
+                        for p in range(k))
+                add(rows + j, idmz + (i*k + l)*ncomp + comp, t**(m - d) * w)
+            j += 1
+
+    return _sparse.csr_matrix((np.concatenate(data_parts),
+                               (np.concatenate(row_parts),
+                                np.concatenate(col_parts))),
+                              shape=(len(x) * mstar, len(fspace)))
+
+class _LRUCache(object):
+    """
+    Thread-safe mapping keeping at most `size` most recently used items.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            value = self.entries.pop(key, None)
+            if value is not None:
+                self.entries[key] = value
+            return value
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries.pop(key, None)
+            self.entries[key] = value
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+_operator_cache = _LRUCache(16)
+
+## Solution archives
+
+_ARCHIVE_MAGIC = b'BVP1LGSA'
+_ARCHIVE_VERSION = 1
+_ARCHIVE_HEADER = np.dtype([('magic', 'S8'), ('version', '<u4'),
+                            ('count', '<u4')])
+_ARCHIVE_INDEX = np.dtype([('flags', '<u8'),
+                           ('ispace_offset', '<u8'), ('ispace_size', '<u8'),
+                           ('fspace_offset', '<u8'), ('fspace_size', '<u8')])
+_ARCHIVE_COMPLEX = 1
+
+def save_solutions(filename, solutions):
+    """
+    Save solutions to a binary archive file.
+
+    The file starts with a header and an index of the offsets of the
+    ``ispace`` and ``fspace`` vectors of each solution, which follow
+    in the same order, aligned to 8 bytes and in little-endian byte
+    order.
+
+    Parameters
+    ----------
+    filename : str
+        Name of the file to write.
+    solutions : sequence of Solution
+        Solutions to save. Solutions of complex-valued problems are
+        restored as such by `load_solutions`.
+    """
+    solutions = list(solutions)
+    index = np.zeros([len(solutions)], _ARCHIVE_INDEX)
+    data = []
+    offset = _ARCHIVE_HEADER.itemsize + index.nbytes
+    for j, solution in enumerate(solutions):
+        if isinstance(solution, _complex_adapter.ComplexSolution):
+            index['flags'][j] = _ARCHIVE_COMPLEX
+            solution = solution.r_solution
+        for name, dtype in [('ispace', '<i4'), ('fspace', '<f8')]:
+            array = np.ascontiguousarray(getattr(solution, name), dtype)
+            index[name + '_offset'][j] = offset
+            index[name + '_size'][j] = array.size
+            data.append(array)
+            offset += array.nbytes
+            if offset % 8:
+                data.append(np.zeros([8 - offset % 8], np.uint8))
+                offset += data[-1].nbytes
+
+    header = np.array([(_ARCHIVE_MAGIC, _ARCHIVE_VERSION, len(solutions))],
+                      _ARCHIVE_HEADER)
+    with open(filename, 'wb') as f:
+        f.write(header.tobytes())
+        f.write(index.tobytes())
+        for array in data:
+            f.write(array.tobytes())
+
+def load_solutions(filename, indices=None, mmap=True):
+    """
+    Load solutions from an archive written by `save_solutions`.
+
+    Parameters
+    ----------
+    filename : str
+        Name of the file to read.
+    indices : sequence of int, optional
+        Positions of the solutions to load. Default is all.
+    mmap : bool, optional
+        Whether to memory-map the solution data instead of reading it.
+        Only the header and the index are then read from the file.
+
+    Returns
+    -------
+    solutions : list of Solution
+    """
+    with open(filename, 'rb') as f:
+        header = np.frombuffer(f.read(_ARCHIVE_HEADER.itemsize),
+                               _ARCHIVE_HEADER)
+        if len(header) != 1 or header['magic'][0] != _ARCHIVE_MAGIC:
+            raise ValueError("%s is not a solution archive" % filename)
+        if header['version'][0] != _ARCHIVE_VERSION:
+            raise ValueError("unsupported solution archive version %d"
+                             % header['version'][0])
+        count = int(header['count'][0])
+        index = np.frombuffer(f.read(count * _ARCHIVE_INDEX.itemsize),
+                              _ARCHIVE_INDEX)
+        if len(index) != count:
+            raise ValueError("truncated solution archive %s" % filename)
+
+        if indices is None:
+            indices = range(count)
+
+        def read(offset, size, dtype):
+            if mmap:
+                return np.memmap(filename, dtype, mode='r',
+                                 offset=int(offset), shape=(int(size),))
+            f.seek(int(offset))
+            return np.fromfile(f, dtype, int(size))
+
+        solutions = []
+        for j in indices:
+            entry = index[j]
+            solution = Solution._from_arrays(
+                read(entry['ispace_offset'], entry['ispace_size'], '<i4'),
+                read(entry['fspace_offset'], entry['fspace_size'], '<f8'))
+            if entry['flags'] & _ARCHIVE_COMPLEX:
+                solution = _complex_adapter.ComplexSolution(solution)
+            solutions.append(solution)
+    return solutions
+
 
 ## Problem types
 
@@ -159,6 +605,145 @@ DEBUG = 2
 
 ## COLNEW
 
+class SolveStats(object):
+    """
+    Statistics of a `solve` call, available as `Solution.stats`.
+
+    Attributes
+    ----------
+    calls : dict
+        Number of calls from COLNEW to each of the user routines
+        'fsub', 'dfsub', 'gsub', 'dgsub' and 'guess'.
+    points : dict
+        Total number of points ``nx`` passed to each user routine.
+        For 'gsub' and 'dgsub', this counts the boundary points.
+    callback_time : dict
+        Wall time in seconds spent in each user routine.
+    fortran_time : float
+        Wall time in seconds spent in COLNEW, outside the user routines.
+    meshes : list of int
+        Numbers of subintervals of the successive meshes.
+    iterations : list of int
+        Numbers of Newton iterations on each of the meshes, as counted
+        by COLNEW. These are zero for linear problems.
+    error_estimates : ndarray
+        The last error estimates of COLNEW for the components of ``z``,
+        or zeros if none were computed.
+    terminated : bool
+        Whether the solve was terminated early by a hook.
+
+    Compiled user routines are not counted, and ``meshes`` and
+    ``iterations`` are recorded only when ``fsub`` is not compiled.
+
+    """
+
+    _routines = ('fsub', 'dfsub', 'gsub', 'dgsub', 'guess')
+
+    def __init__(self):
+        self.calls = dict((name, 0) for name in self._routines)
+        self.points = dict((name, 0) for name in self._routines)
+        self.callback_time = dict((name, 0.0) for name in self._routines)
+        self.fortran_time = 0.0
+        self.meshes = []
+        self.iterations = []
+        self.error_estimates = None
+        self.terminated = False
+        self._on_iteration = None
+        self._on_mesh = None
+        self._fspace = None
+        self._lib = None
+
+    def _recording(self, name, func):
+        """Make a COLNEW callback that records its calls to `func`"""
+        def wrapper(*args):
+            if name == 'fsub':
+                self._record_mesh()
+            start = _timer()
+            try:
+                func(*args)
+            finally:
+                self.callback_time[name] += _timer() - start
+                self.calls[name] += 1
+                self.points[name] += np.shape(args[0])[-1]
+        return wrapper
+
+    def _record_mesh(self):
+        """Record the current mesh size and Newton iteration of COLNEW"""
+        lib = self._lib
+        n = int(lib.colapr.n)
+        iteration = int(lib.colnln.iter)
+        # The iteration count restarts on each new mesh
+        if (not self.meshes or n != self.meshes[-1]
+                or iteration < self.iterations[-1]):
+            self.meshes.append(n)
+            self.iterations.append(iteration)
+            if self._on_mesh is not None:
+                # The mesh is at the start of the workspace
+                mstar = int(lib.colord.mstar)
+                self._notify(self._on_mesh, MeshInfo(
+                    len(self.meshes) - 1,
+                    np.array(self._fspace[:n+1]),
+                    np.array(lib.colerr.errest[:mstar])))
+        elif iteration > self.iterations[-1]:
+            self.iterations[-1] = iteration
+            if self._on_iteration is not None:
+                self._notify(self._on_iteration, IterationInfo(
+                    len(self.meshes) - 1, iteration,
+                    float(lib.colitr.rnorm),
+                    float(lib.colitr.relax),
+                    np.array(self._fspace[:n+1])))
+
+    def _notify(self, hook, info):
+        """Call a hook, and terminate COLNEW if it requests so"""
+        if hook(info) and not self.terminated:
+            # COLNEW accepts the current iterate at the next convergence
+            # test and error check
+            self.terminated = True
+            self._lib.colest.tolin[...] = np.inf
+
+    def __repr__(self):
+        return ("<SolveStats: %d meshes, %d iterations, calls %r, "
+                "%.3g s in callbacks, %.3g s in COLNEW>"
+                % (len(self.meshes), sum(self.iterations), self.calls,
+                   sum(self.callback_time.values()), self.fortran_time))
+
+IterationInfo = collections.namedtuple(
+    'IterationInfo',
+    ['mesh_number', 'iteration', 'residual_norm', 'relaxation', 'mesh'])
+IterationInfo.__doc__ = """
+Record of a Newton iteration of COLNEW, passed to ``on_iteration``.
+
+Attributes
+----------
+mesh_number : int
+    Index of the current mesh, counting from 0.
+iteration : int
+    Number of Newton iterations done on the current mesh.
+residual_norm : float
+    Norm of the residual of the collocation equations, as last
+    computed by COLNEW.
+relaxation : float
+    Relaxation factor of the last damped Newton step.
+mesh : ndarray
+    The current mesh points.
+"""
+
+MeshInfo = collections.namedtuple(
+    'MeshInfo', ['mesh_number', 'mesh', 'error_estimates'])
+MeshInfo.__doc__ = """
+Record of a new mesh of COLNEW, passed to ``on_mesh``.
+
+Attributes
+----------
+mesh_number : int
+    Index of the new mesh, counting from 0.
+mesh : ndarray
+    The new mesh points.
+error_estimates : ndarray
+    Error estimates for the components of ``z`` from the last error
+    check on the previous meshes, or zeros if there was none yet.
+"""
+
 def solve(boundary_points,
           degrees, fsub, gsub,
           dfsub=None, dgsub=None,
@@ -176,6 +761,16 @@ def solve(boundary_points,
           maximum_mesh_size=100,
           vectorized=True,
           is_complex=False,
+          mesh_size_growth=None,
+          maximum_workspace_size=2**28,
+          jac_sparsity=None,
+          jacobian_method='forward',
+          fdfsub=None,
+          inplace=False,
+          on_iteration=None,
+          on_mesh=None,
+          threads=None,
+          abd_solver='sequential',
           ):
     r"""
     Solve a multi-point boundary value problem for a system of ODEs.
@@ -296,9 +891,73 @@ def solve(boundary_points,
         Usually, SENSITIVE should not be needed.
     maximum_mesh_size : int, optional
         Maximum number of points to allow in the mesh.
+    mesh_size_growth : float, optional
+        If given, when the mesh does not fit in ``maximum_mesh_size``
+        points, the workspace is enlarged by this factor and COLNEW
+        continues from the last mesh and iterate it reached, instead of
+        raising `TooManySubintervals`.
+    maximum_workspace_size : int, optional
+        Upper limit in bytes for the enlarged workspace, including the
+        values at the collocation points that COLNEW allocates
+        separately, when `mesh_size_growth` is given.
     is_complex : bool, optional
         Whether the problem is complex-valued.
         The equation must be analytical in the unknown variables.
+    jac_sparsity : array_like of bool, optional
+        Sparsity pattern of ``dfsub``, as an array of shape
+        ``(ncomp, mstar)``, True where the partial derivative may be
+        nonzero. If given and ``dfsub`` is None, the numerical partial
+        derivatives perturb groups of independent components together,
+        so that fewer evaluations of ``fsub`` are needed.
+    jacobian_method : {'forward', 'complex'}, optional
+        How to compute the partial derivatives, when ``dfsub`` or
+        ``dgsub`` is not given. 'forward' uses forward differences.
+        'complex' uses complex steps, which give derivatives accurate
+        to rounding error. This needs ``fsub`` and ``gsub`` that are
+        real-analytic and accept complex arguments, and is not
+        available for complex-valued problems.
+    fdfsub : callable, optional
+        Function and its Jacobian together, given as
+        ``def fdfsub(x, z): return f, df`` with ``f`` and ``df`` as
+        returned by ``fsub`` and ``dfsub``. If given, it replaces
+        ``fsub`` and ``dfsub``, which can be None. COLNEW evaluates
+        ``f`` and ``df`` at the same points, so one call serves
+        both, and intermediate results can be shared between them.
+        Requires vectorized functions.
+    inplace : bool, optional
+        Whether ``fsub``, ``dfsub``, ``gsub`` and ``dgsub`` write their
+        result to an extra output argument instead of returning it, as
+        in ``def fsub(x, z, f): f[...] = ...``. The output arguments
+        are views of COLNEW's arrays, so the results are written into
+        them directly rather than returned and copied. Requires
+        vectorized functions and real-valued problems.
+    on_iteration : callable, optional
+        Called as ``on_iteration(info)`` during each Newton iteration,
+        with an `IterationInfo` record.
+    on_mesh : callable, optional
+        Called as ``on_mesh(info)`` when COLNEW starts on a new mesh,
+        with a `MeshInfo` record.
+
+        If ``on_iteration`` or ``on_mesh`` returns True, the solve is
+        terminated early: COLNEW then accepts the current iterate at its
+        next convergence test, and returns it as the solution, with
+        ``solution.stats.terminated`` set. The hooks are called from
+        ``fsub``, so it cannot be compiled.
+    threads : int, optional
+        Number of threads for building and condensing the collocation
+        blocks of the subintervals in parallel. By default, the number
+        set by OpenMP (``OMP_NUM_THREADS``) is used. This has an effect
+        only if the extension was built with OpenMP.
+    abd_solver : {'sequential', 'partitioned'}, optional
+        How to solve the almost block diagonal linear system of the
+        collocation method. 'sequential' (default) is COLNEW's own
+        solver, which goes through the subintervals in order.
+        'partitioned' splits the subintervals into as many groups as
+        ``threads`` (or CPUs, if not given), eliminates within the groups
+        in parallel, and then solves a small system for the values at
+        their ends. It needs about as much memory again as the rest of
+        the workspace, and runs in parallel only if the extension was
+        built with OpenMP.
 
     Returns
     -------
@@ -312,372 +971,1381 @@ def solve(boundary_points,
     scikits.bvp1lg.NoConvergence
         Numerical convergence problems
     scikits.bvp1lg.TooManySubintervals
-        ``maximum_mesh_size`` too small to satisfy tolerances
+        ``maximum_mesh_size`` (or ``maximum_workspace_size``)
+        too small to satisfy tolerances
     scikits.bvp1lg.SingularCollocationMatrix
         Singular collocation matrix (check your jacobians)
+    MemoryError
+        Not enough memory for the values at the collocation points
     SystemError
         Invalid output from user routines. (FIXME: these should be fixed)
 
+    Notes
+    -----
+    ``fsub``, ``dfsub``, ``gsub``, ``dgsub`` and ``initial_guess`` can
+    also be compiled functions, given as `ctypes` or `cffi` function
+    pointers, PyCapsules, or `scipy.LowLevelCallable` objects. COLNEW
+    then calls them directly, without going through Python. They take
+    the Fortran argument lists, as the C functions::
+
+        void fsub(int *ncomp, int *mstar, int *nx,
+                  double *x, double *z, double *f);
+        void dfsub(int *ncomp, int *mstar, int *nx,
+                   double *x, double *z, double *df);
+        void gsub(int *ncomp, int *mstar, double *z, double *g);
+        void dgsub(int *ncomp, int *mstar, double *z, double *dg);
+        void guess(int *ncomp, int *mstar, int *nx,
+                   double *x, double *z, double *dm);
+
+    with the arrays above in Fortran order, for example
+    ``z[i + mstar*k]`` and ``df[i + ncomp*(j + mstar*k)]``, except that
+    ``dg[j + mstar*i] = d g_i / d z_j``. They are always vectorized, and
+    compiled ``fsub`` and ``gsub`` require ``dfsub`` and ``dgsub`` to be
+    given.
+
     """
 
+    problem = Problem(boundary_points,
+                      degrees, fsub, gsub,
+                      dfsub=dfsub, dgsub=dgsub,
+                      left=left, right=right,
+                      is_linear=is_linear,
+                      tolerances=tolerances,
+                      adaptive_mesh_selection=adaptive_mesh_selection,
+                      verbosity=verbosity,
+                      collocation_points=collocation_points,
+                      extra_fixed_points=extra_fixed_points,
+                      problem_regularity=problem_regularity,
+                      maximum_mesh_size=maximum_mesh_size,
+                      vectorized=vectorized,
+                      is_complex=is_complex,
+                      mesh_size_growth=mesh_size_growth,
+                      maximum_workspace_size=maximum_workspace_size,
+                      jac_sparsity=jac_sparsity,
+                      jacobian_method=jacobian_method,
+                      fdfsub=fdfsub,
+                      inplace=inplace,
+                      on_iteration=on_iteration,
+                      on_mesh=on_mesh,
+                      threads=threads,
+                      abd_solver=abd_solver)
+    # One-shot problems share workspace through the pool
+    problem._pooled = True
+    return problem.solve(initial_guess,
+                         coarsen_initial_guess_mesh=coarsen_initial_guess_mesh,
+                         initial_mesh=initial_mesh)
+
+def solve_many(problem_factory, params, workers=None, chunksize=None,
+               **kw):
+    r"""
+    Solve a family of boundary value problems in parallel.
+
+    The problems are solved in a pool of worker processes. Each worker
+    process has its own fresh copy of the COLNEW state, so the solves
+    are fully independent.
+
+    Parameters
+    ----------
+    problem_factory : callable
+        Function ``def problem_factory(p): return args``, returning
+        a dictionary of keyword arguments to `solve` for the parameter
+        value ``p``. It is called in the worker processes, and so it must
+        be picklable, e.g., a function defined at the module level.
+    params : sequence
+        Parameter values to pass to `problem_factory`.
+        They must be picklable.
+    workers : int, optional
+        Number of worker processes. If None, the number of CPUs is used.
+        If 1, the problems are solved serially in the current process.
+    chunksize : int, optional
+        Number of problems to send to a worker process at once.
+        If None, a sensible default is used.
+    **kw
+        Additional keyword arguments to `solve`, common to all problems.
+        The arguments returned by `problem_factory` take precedence.
+
+    Returns
+    -------
+    results : list
+        One item for each parameter value, in the order of ``params``.
+        Each item is either the `Solution`, or the exception raised
+        when solving the problem (for instance,
+        `scikits.bvp1lg.NoConvergence`). A failure does not abort
+        solving the rest of the problems.
+
+    Examples
+    --------
+    Solve ``u'' = -p**2 u`` for many values of ``p`` (the problem factory
+    must be defined at the module level):
+
+    >>> def problem(p):
+    ...     return dict(boundary_points=[0, 1], degrees=[2],
+    ...                 fsub=lambda x, z: -p**2 * z[:1],
+    ...                 gsub=lambda z: np.array([z[0,0], z[0,1] - 1]),
+    ...                 is_linear=True)
+    >>> results = solve_many(problem, [0.5, 1, 1.5], workers=1)
+    >>> [round(float(sol(1)[0]), 6) for sol in results]
+    [1.0, 1.0, 1.0]
+
+    """
+    items = [(problem_factory, p, kw) for p in params]
+
+    if workers == 1:
+        return [_solve_many_item(item) for item in items]
+
+    # Use fresh processes rather than forks: a fork could inherit
+    # COMMON blocks or locks of a solve running in another thread.
     try:
-        _colnew_enter()
-        return _colnew_solve(boundary_points,
-                             degrees, fsub, gsub,
-                             dfsub, dgsub,
-                             left, right,
-                             is_linear,
-                             initial_guess,
-                             coarsen_initial_guess_mesh,
-                             initial_mesh,
-                             tolerances,
-                             adaptive_mesh_selection,
-                             verbosity,
-                             collocation_points,
-                             extra_fixed_points,
-                             problem_regularity,
-                             maximum_mesh_size,
-                             vectorized,
-                             is_complex)
+        context = multiprocessing.get_context('spawn')
+    except AttributeError:
+        context = multiprocessing
+
+    pool = context.Pool(processes=workers)
+    try:
+        return pool.map(_solve_many_item, items, chunksize)
     finally:
-        _colnew_exit()
-
-def _colnew_solve(boundary_points,
-                  degrees, fsub, gsub,
-                  dfsub, dgsub,
-                  left, right,
-                  is_linear,
-                  initial_guess,
-                  coarsen_initial_guess_mesh,
-                  initial_mesh,
-                  tolerances,
-                  adaptive_mesh_selection,
-                  verbosity,
-                  collocation_points,
-                  extra_fixed_points,
-                  problem_regularity,
-                  maximum_mesh_size,
-                  vectorized,
-                  is_complex):
-
-    ## Handle complex equations
-    if is_complex:
-        c_adapter = _complex_adapter.ComplexAdapter(boundary_points, degrees,
-                                                    fsub, gsub, dfsub, dgsub,
-                                                    tolerances)
-
-        boundary_points = c_adapter.boundary_points
-        degrees = c_adapter.degrees
-        fsub = c_adapter.fsub
-        gsub = c_adapter.gsub
-        dfsub = c_adapter.dfsub
-        dgsub = c_adapter.dgsub
-        tolerances = c_adapter.tolerances
-
-
-    ## Check degrees
+        pool.terminate()
+        pool.join()
 
-    ncomp = len(degrees)
-    mstar = int(sum(degrees))
+def _solve_many_item(item):
+    """
+    Solve a single problem for `solve_many`, capturing errors.
+    """
+    problem_factory, p, kw = item
+    try:
+        args = dict(kw)
+        args.update(problem_factory(p))
+        return solve(**args)
+    except Exception as e:
+        return e
 
-    if np.sometrue(list(map(lambda x: x <= 0 or x > 4, degrees))):
-        raise ValueError("Invalid value for ``degrees``")
+def _filling(func):
+    """
+    Make ``func(*args)`` write its result to the extra argument ``out``,
+    as the callbacks of `_colnew.colnew` do.
+    """
+    def wrapper(*args):
+        out = args[-1]
+        out[...] = np.reshape(np.asarray(func(*args[:-1])), out.shape)
+    return wrapper
 
-    if ncomp <= 0 or mstar <= 0:
-        raise ValueError("Invalid value for ``degrees``: no equations")
+def _filling_guess(guess):
+    """
+    Make ``guess(x)`` fill in ``z`` and ``dmval``, as `_filling`.
+    """
+    def wrapper(x, z, dmval):
+        z_value, dmval_value = guess(x)
+        z[...] = np.reshape(np.asarray(z_value), z.shape)
+        dmval[...] = np.reshape(np.asarray(dmval_value), dmval.shape)
+    return wrapper
 
-    # keep these in sync with colnew.f
-    if ncomp > 256:
-        raise ValueError("Too many equations")
-    if mstar > 512:
-        raise ValueError("Too many unknown variables")
+def _allocating(func, shape):
+    """
+    Make ``func(*args, out)``, writing to ``out``, return its result.
+    """
+    def wrapper(*args):
+        out = np.zeros(shape(*args), dtype=np.result_type(args[-1], float))
+        func(*(args + (out,)))
+        return out
+    return wrapper
 
-    ## Defaults
+class _LastCall(object):
+    """
+    Wrap ``func(x, z)``, remembering the result of the last call, so
+    that the next user of the same arguments can take it instead of
+    calling ``func`` again.
 
-    if collocation_points == None:
-        collocation_points = 0
-    elif collocation_points < max(degrees) or collocation_points > 7:
-        raise ValueError("Invalid number of collocation points")
+    The arguments are recognized by their address and shape, not by
+    their values, so the result can be taken only once.
+    """
 
-    if extra_fixed_points == None:
-        extra_fixed_points = []
+    def __init__(self, func):
+        self.func = func
+        self.key = None
+        self.result = None
+
+    def __call__(self, x, z):
+        self.result = self.func(x, z)
+        self.key = _array_key(x, z)
+        return self.result
+
+    def lookup(self, x, z):
+        """Take the result of the last call, if it had these arguments"""
+        result = None
+        if self.key is not None and self.key == _array_key(x, z):
+            result = self.result
+        self.key = None
+        self.result = None
+        return result
+
+def _array_key(*arrays):
+    """Address, shape and strides of arrays"""
+    key = []
+    for a in arrays:
+        a = np.asarray(a)
+        key.append((a.__array_interface__['data'][0], a.shape, a.strides))
+    return tuple(key)
+
+class _ParamsCell(threading.local):
+    """
+    ``params[0]`` of the solves of a `Problem`, kept separately for each
+    thread, as the problem can be solved in several at the same time.
+    """
 
-    if tolerances == None:
-        tolerances = np.zeros([mstar])
+    def __init__(self):
+        self.cell = [None]
 
-    if left == None:
-        left = min(boundary_points)
+    def __getitem__(self, index):
+        return self.cell[index]
 
-    if right == None:
-        right = max(boundary_points)
+    def __setitem__(self, index, value):
+        self.cell[index] = value
 
-    ## Calculate needed workspace size
+def _with_params(func, params, nout=0):
+    """
+    Make ``func(*args, p, *out)``, with ``nout`` output arguments, callable
+    as ``func(*args, *out)``, passing ``p = params[0]`` at the time of
+    the call.
+    """
+    def wrapper(*args):
+        n = len(args) - nout
+        return func(*(args[:n] + (params[0],) + args[n:]))
+    return wrapper
 
-    k = int(collocation_points)
-    kd = k * ncomp
-    kdm = kd + mstar
-    nsizei = 3 + kdm
-    nispace = maximum_mesh_size * nsizei
+class Problem(object):
+    """
+    A boundary value problem prepared for repeated solving with COLNEW.
 
-    nrec = 0
-    nsizef = 4 + 3*mstar + (5+kd) * kdm + (2*mstar-nrec)*2*mstar
-    nfspace = maximum_mesh_size * nsizef
+    The problem definition is checked and converted to the form COLNEW
+    needs once, when the problem is created, and the problem keeps its
+    own workspace between solves. Solving it repeatedly, for example in
+    a sweep over initial guesses or parameters, then has little
+    overhead besides COLNEW itself.
 
-    ## Allocate work space
+    Parameters
+    ----------
+    boundary_points, degrees, fsub, gsub, dfsub, dgsub, ...
+        As for `solve`. The arguments that give the initial guess and
+        the initial mesh are instead given to `Problem.solve`.
 
-    ispace = np.empty([nispace], np.int32)
-    fspace = np.empty([nfspace], np.float64)
+    """
 
-    ## Boundary points
+    # Use the shared workspace pool instead of a workspace of our own
+    _pooled = False
+
+    def __init__(self, boundary_points,
+                 degrees, fsub, gsub,
+                 dfsub=None, dgsub=None,
+                 left=None, right=None,
+                 is_linear=False,
+                 tolerances=None,
+                 adaptive_mesh_selection=True,
+                 verbosity=0,
+                 collocation_points=None,
+                 extra_fixed_points=None,
+                 problem_regularity=REGULAR,
+                 maximum_mesh_size=100,
+                 vectorized=True,
+                 is_complex=False,
+                 mesh_size_growth=None,
+                 maximum_workspace_size=2**28,
+                 jac_sparsity=None,
+                 jacobian_method='forward',
+                 fdfsub=None,
+                 inplace=False,
+                 on_iteration=None,
+                 on_mesh=None,
+                 threads=None,
+                 abd_solver='sequential',
+                 ):
+
+        ## Compiled callbacks are passed on to COLNEW as they are
+        native = [_lowlevel.capsule(func)
+                  for func in (fsub, dfsub, gsub, dgsub)]
+        if any(func is not None for func in native):
+            if is_complex or inplace or fdfsub is not None:
+                raise ValueError("Compiled functions cannot be used with "
+                                 "``is_complex``, ``inplace`` or ``fdfsub``")
+            if ((native[0] is not None and dfsub is None)
+                    or (native[2] is not None and dgsub is None)):
+                raise ValueError("Compiled ``fsub`` and ``gsub`` require "
+                                 "``dfsub`` and ``dgsub``")
+            if native[0] is not None and (on_iteration is not None
+                                          or on_mesh is not None):
+                raise ValueError("``on_iteration`` and ``on_mesh`` require "
+                                 "``fsub`` that is not compiled")
+
+        if inplace:
+            if not vectorized or is_complex or fdfsub is not None:
+                raise ValueError("``inplace`` requires vectorized "
+                                 "functions, a real-valued problem, and no "
+                                 "``fdfsub``")
+
+        if fdfsub is not None:
+            if not vectorized:
+                raise ValueError("``fdfsub`` requires vectorized functions")
+        elif fsub is None:
+            raise ValueError("Either ``fsub`` or ``fdfsub`` must be given")
+
+        if jacobian_method not in ('forward', 'complex'):
+            raise ValueError("Invalid value for ``jacobian_method``")
+
+        if threads is None:
+            # let OpenMP decide
+            threads = 0
+        elif threads < 1:
+            raise ValueError("Invalid value for ``threads``")
+
+        if abd_solver == 'sequential':
+            abd_groups = 0
+        elif abd_solver == 'partitioned':
+            abd_groups = int(threads) or multiprocessing.cpu_count()
+        else:
+            raise ValueError("Invalid value for ``abd_solver``")
 
-    if len(boundary_points) != mstar:
-        raise ValueError("Invalid number of boundary points")
+        self._routines = (fsub, dfsub, gsub, dgsub, fdfsub)
+        self._native = native
+        self._complex_problem = (boundary_points, degrees, tolerances,
+                                 jac_sparsity)
 
-    zeta = np.asarray(boundary_points, np.float64)
-    zeta.sort()
+        ## Handle complex equations
+        if is_complex:
+            if jacobian_method == 'complex':
+                raise ValueError("Complex-step partial derivatives are not "
+                                 "available for complex-valued problems")
+            c_adapter = _complex_adapter.ComplexAdapter(
+                boundary_points, degrees, fsub, gsub, dfsub, dgsub,
+                tolerances, jac_sparsity)
 
-    if not np.alltrue(zeta == boundary_points):
-        raise ValueError("Invalid ordering of boundary points")
+            boundary_points = c_adapter.boundary_points
+            degrees = c_adapter.degrees
+            tolerances = c_adapter.tolerances
+            jac_sparsity = c_adapter.jac_sparsity
 
-    if not np.alltrue((zeta >= left) & (zeta <= right)):
-        raise ValueError("Some boundary points outside range [left, right]")
+        ## Check degrees
 
-    ## Fixed points in the mesh
+        ncomp = len(degrees)
+        mstar = int(sum(degrees))
 
-    fixpnt = list(boundary_points) + list(extra_fixed_points)
-    fixpnt.sort()
-    fixpnt = list(filter(lambda x: x > left and x < right, fixpnt))
-    fixpnt = np.unique(np.array(fixpnt, np.float_).ravel())
+        if np.sometrue(list(map(lambda x: x <= 0 or x > 4, degrees))):
+            raise ValueError("Invalid value for ``degrees``")
 
-    ## Verbosity
+        if ncomp <= 0 or mstar <= 0:
+            raise ValueError("Invalid value for ``degrees``: no equations")
 
-    if verbosity < 0:
-        verbosity = 0
-    elif verbosity > 2:
-        verbosity = 2
+        # keep these in sync with colnew.f
+        if ncomp > 256:
+            raise ValueError("Too many equations")
+        if mstar > 512:
+            raise ValueError("Too many unknown variables")
 
-    ## Tolerances
+        if jac_sparsity is not None:
+            jac_sparsity = np.asarray(jac_sparsity, dtype=bool)
+            if jac_sparsity.shape != (ncomp, mstar):
+                raise ValueError("``jac_sparsity`` must have shape "
+                                 "(ncomp, mstar)")
 
-    if len(tolerances) != mstar:
-        raise ValueError("Invalid number of tolerances")
+        ## Defaults
 
-    tolerances = np.asarray(tolerances, np.float64).ravel()
-    ltol = np.where(tolerances > 0)[0]
-    tol = tolerances[ltol]
-    ltol += 1 # Fortran-style indexing
+        if collocation_points == None:
+            collocation_points = 0
+        elif collocation_points < max(degrees) or collocation_points > 7:
+            raise ValueError("Invalid number of collocation points")
 
-    ## Parameters to COLNEW
+        if extra_fixed_points == None:
+            extra_fixed_points = []
 
-    ipar = np.array([
-        1 - int(is_linear),  # is the problem nonlinear?
-        collocation_points,  # no. collocation points per subinterval
-        10,                  # no. subintervals in initial mesh
-        len(ltol),           # no. solution and derivative tolerances
-        len(fspace),         # float workspace length
-        len(ispace),         # integer workspace length
-        1 - verbosity,       # output control
-        0,                   # initial mesh type (see below)
-        0,                   # initial guess type (see below)
-        problem_regularity,  # problem regularity
-        len(fixpnt),         # number of additional fixed points
-        ], np.int32)
+        if mesh_size_growth is not None and mesh_size_growth <= 1:
+            raise ValueError("mesh_size_growth must be larger than 1")
+
+        if tolerances == None:
+            tolerances = np.zeros([mstar])
+
+        if left == None:
+            left = min(boundary_points)
+
+        if right == None:
+            right = max(boundary_points)
+
+        ## Calculate needed workspace size
+
+        k = int(collocation_points)
+        if k == 0:
+            # COLNEW's default
+            k = max(max(degrees) + 1, 5 - max(degrees))
+        kd = k * ncomp
+        kdm = kd + mstar
+        self._nsizei = 3 + kdm
+
+        nrec = 0
+        self._nsizef = 4 + 3*mstar + (5+kd) * kdm + (2*mstar-nrec)*2*mstar
+
+        # values at the collocation points, allocated separately by COLNEW
+        self._nsizeh = k * (mstar + ncomp*mstar + 1)
+
+        # factors of the partitioned ABD solver, allocated in _solve
+        self._nsizep = 5*mstar*mstar if abd_groups else 0
+
+        ## Boundary points
+
+        if len(boundary_points) != mstar:
+            raise ValueError("Invalid number of boundary points")
+
+        zeta = np.asarray(boundary_points, np.float64)
+        zeta.sort()
+
+        if not np.alltrue(zeta == boundary_points):
+            raise ValueError("Invalid ordering of boundary points")
+
+        if not np.alltrue((zeta >= left) & (zeta <= right)):
+            raise ValueError("Some boundary points outside range "
+                             "[left, right]")
+
+        ## Fixed points in the mesh
+
+        fixpnt = list(boundary_points) + list(extra_fixed_points)
+        fixpnt.sort()
+        fixpnt = list(filter(lambda x: x > left and x < right, fixpnt))
+        fixpnt = np.unique(np.array(fixpnt, np.float_).ravel())
+
+        ## Verbosity
+
+        if verbosity < 0:
+            verbosity = 0
+        elif verbosity > 2:
+            verbosity = 2
+
+        ## Tolerances
+
+        if len(tolerances) != mstar:
+            raise ValueError("Invalid number of tolerances")
+
+        tolerances = np.asarray(tolerances, np.float64).ravel()
+        ltol = np.where(tolerances > 0)[0]
+        tol = tolerances[ltol]
+        ltol += 1 # Fortran-style indexing
+
+        ## Parameters to COLNEW
+
+        ipar = np.array([
+            1 - int(is_linear),  # is the problem nonlinear?
+            collocation_points,  # no. collocation points per subinterval
+            10,                  # no. subintervals in initial mesh
+            len(ltol),           # no. solution and derivative tolerances
+            0,                   # float workspace length (see solve)
+            0,                   # integer workspace length (see solve)
+            1 - verbosity,       # output control
+            0,                   # initial mesh type (see solve)
+            0,                   # initial guess type (see solve)
+            problem_regularity,  # problem regularity
+            len(fixpnt),         # number of additional fixed points
+            ], np.int32)
+
+        if len(fixpnt) == 0:
+            fixpnt = np.array([0], np.float64)
+
+        self.degrees = degrees
+        self.ncomp = ncomp
+        self.mstar = mstar
+        self.k = k
+        self.left = left
+        self.right = right
+        self.is_complex = is_complex
+        self.vectorized = vectorized
+        self.adaptive_mesh_selection = adaptive_mesh_selection
+        self.maximum_mesh_size = maximum_mesh_size
+        self.mesh_size_growth = mesh_size_growth
+        self.maximum_workspace_size = maximum_workspace_size
+        self._jac_sparsity = jac_sparsity
+        self._jacobian_method = jacobian_method
+        self._inplace = inplace
+        self._on_iteration = on_iteration
+        self._on_mesh = on_mesh
+        self._threads = int(threads)
+        self._abd_groups = abd_groups
+        self._zeta = zeta
+        self._fixpnt = fixpnt
+        self._ltol = ltol
+        self._tol = tol
+        self._ipar = ipar
+        self._workspace = None
+
+        ## Callbacks, and those passing parameters, built when needed
+        self._params = _ParamsCell()
+        self._callbacks = {False: self._make_callbacks(None)}
+
+    def _make_callbacks(self, params):
+        """
+        Make the ``fsub``, ``dfsub``, ``gsub`` and ``dgsub`` callbacks
+        of COLNEW, passing ``params[0]`` to the user routines if
+        `params` is not None.
+        """
+        fsub, dfsub, gsub, dgsub, fdfsub = self._routines
+        native = self._native
+        inplace = self._inplace
+        ncomp = self.ncomp
+        mstar = self.mstar
+        jac_sparsity = self._jac_sparsity
+        jacobian_method = self._jacobian_method
+
+        if params is not None:
+            nout = int(bool(inplace))
+            if fsub is not None:
+                fsub = _with_params(fsub, params, nout)
+            if dfsub is not None:
+                dfsub = _with_params(dfsub, params, nout)
+            if fdfsub is not None:
+                fdfsub = _with_params(fdfsub, params)
+            gsub = _with_params(gsub, params, nout)
+            if dgsub is not None:
+                dgsub = _with_params(dgsub, params, nout)
+
+        ## In-place callbacks: allocating versions for use within Python
+        if inplace:
+            inplace_callbacks = [fsub, dfsub, gsub, dgsub]
+            fsub = _allocating(fsub, lambda x, z: [ncomp, len(x)])
+            gsub = _allocating(gsub, lambda z: [z.shape[0]])
+            if dfsub is not None:
+                dfsub = _allocating(dfsub, lambda x, z: [ncomp, z.shape[0],
+                                                         len(x)])
+            if dgsub is not None:
+                dgsub = _allocating(dgsub, lambda z: [z.shape[0],
+                                                      z.shape[0]])
+            allocating_callbacks = [fsub, dfsub, gsub, dgsub]
+
+        ## Split a fused RHS; COLNEW calls fsub and dfsub at the same points.
+        ## A dfsub call without an fsub call before it, when COLNEW updates
+        ## the Jacobian, is at the point values of the last fsub call.
+        if fdfsub is not None:
+            fused = _LastCall(fdfsub)
+            def fsub(x, z):
+                return fused(x, z)[0]
+            def dfsub(x, z):
+                result = fused.lookup(x, z)
+                if result is None:
+                    result = fused.func(x, z)
+                return result[1]
+
+        ## Handle complex equations
+        if self.is_complex:
+            boundary_points, degrees, tolerances, _ = self._complex_problem
+            c_adapter = _complex_adapter.ComplexAdapter(
+                boundary_points, degrees, fsub, gsub, dfsub, dgsub,
+                tolerances, jac_sparsity)
+            fsub = c_adapter.fsub
+            gsub = c_adapter.gsub
+            dfsub = c_adapter.dfsub
+            dgsub = c_adapter.dgsub
+
+        ## Compatibility with non-vectorized functions
+
+        def vectorized_f(x, u):
+            fs = []
+            for i, xx in enumerate(x):
+                fs.append(fsub(float(xx), u[:,i]))
+            return np.transpose(np.asarray(fs))
+
+        def vectorized_df(x, u):
+            dfs = []
+            for i, xx in enumerate(x):
+                dfs.append(dfsub(float(xx), u[:,i]))
+            dfs = np.asarray(dfs)
+            return np.swapaxes(np.swapaxes(dfs, 0, 2), 0, 1)
+
+        if self.vectorized:
+            vectorized_f = fsub
+            vectorized_df = dfsub
+
+        ## Numerical evaluation of Jacobians, if needed
+
+        def numerical_dg(z):
+            zero = np.zeros([z.shape[0]])
+            # Surprisingly easy: numpy's indexing & broadcasting rocks.
+            # Extra reshape needed for gsubs returning matrices.
+            return _jacobian.jacobian(
+                lambda u: np.reshape(gsub(z + u[:,None]), [mstar]),
+                zero, method=jacobian_method)
+
+        if dgsub == None:
+            dgsub = numerical_dg
+
+        def numerical_df(x, z):
+            # fsub is local in x, so all perturbations go in a single call.
+            # The unperturbed values come from COLNEW's preceding fsub call.
+            # Extra reshape needed for fsubs returning matrices.
+            f0 = vectorized_f.lookup(x, z)
+            if f0 is not None:
+                f0 = np.reshape(f0, [ncomp, x.shape[0]])
+            return _jacobian.local_jacobian(
+                lambda xx, zz: np.reshape(vectorized_f.func(xx, zz),
+                                          [ncomp, xx.shape[0]]),
+                x, z, sparsity=jac_sparsity, method=jacobian_method, f0=f0)
+
+        if dfsub == None:
+            vectorized_f = _LastCall(vectorized_f)
+            vectorized_df = numerical_df
+
+        ## Callbacks fill in COLNEW's arrays
+
+        callbacks = [vectorized_f, vectorized_df, gsub, dgsub]
+        for j, func in enumerate(callbacks):
+            if native[j] is not None:
+                callbacks[j] = native[j]
+            elif inplace and func is allocating_callbacks[j]:
+                callbacks[j] = inplace_callbacks[j]
+            else:
+                callbacks[j] = _filling(func)
+        return callbacks
+
+    def _acquire_workspace(self, maximum_mesh_size):
+        """Get the ``(ispace, fspace)`` arrays for a solve"""
+        nispace = maximum_mesh_size * self._nsizei
+        nfspace = maximum_mesh_size * self._nsizef
+        if self._pooled:
+            key = (self.ncomp, self.mstar, self.k, maximum_mesh_size)
+            return _workspace_pool.acquire(key, nispace, nfspace)
+
+        # Taken for the duration of the solve, so that nested solves of
+        # the same problem get separate arrays
+        workspace, self._workspace = self._workspace, None
+        if (workspace is None or len(workspace[0]) != nispace
+                or len(workspace[1]) != nfspace):
+            workspace = (np.empty([nispace], np.int32),
+                         np.empty([nfspace], np.float64))
+        return workspace
+
+    def _release_workspace(self, maximum_mesh_size, ispace, fspace):
+        """Return the arrays got from `_acquire_workspace`"""
+        if self._pooled:
+            key = (self.ncomp, self.mstar, self.k, maximum_mesh_size)
+            _workspace_pool.release(key, ispace, fspace)
+        elif maximum_mesh_size == self.maximum_mesh_size:
+            self._workspace = (ispace, fspace)
+
+    def solve(self, initial_guess=None, params=None,
+              coarsen_initial_guess_mesh=True, initial_mesh=None):
+        """
+        Solve the problem.
+
+        Parameters
+        ----------
+        initial_guess, coarsen_initial_guess_mesh, initial_mesh
+            As for `solve`.
+        params : object, optional
+            If given, it is passed to ``fsub``, ``dfsub``, ``gsub``,
+            ``dgsub`` and ``fdfsub`` as an extra argument after the
+            others, as in ``def fsub(x, z, params)``, or before the
+            output arguments for ``inplace`` functions, as in
+            ``def fsub(x, z, params, f)``.
 
-    if len(fixpnt) == 0:
-        fixpnt = np.array([0], np.float64)
+        Returns
+        -------
+        sol : Solution
+            Object representing the solution.
 
-    ## Initial guess
+        Raises
+        ------
+        As for `solve`.
 
-    def dummy_guess(x): raise ValueError("Invalid initial guess")
+        """
+        saved_params = self._params[0]
+        lib = _colnew_enter()
+        try:
+            return self._solve(lib, initial_guess, params,
+                               coarsen_initial_guess_mesh, initial_mesh)
+        finally:
+            self._params[0] = saved_params
+            _colnew_exit(lib)
+
+    def _bind_params(self, params):
+        """
+        Get the callbacks of COLNEW passing `params` to the user routines,
+        if it is not None. The caller restores the previous value of
+        ``self._params[0]`` after use, as the user routines may solve the
+        same problem with other parameters.
+        """
+        if params is not None:
+            if any(func is not None for func in self._native):
+                raise ValueError("``params`` cannot be passed to compiled "
+                                 "functions")
+            if True not in self._callbacks:
+                self._callbacks[True] = self._make_callbacks(self._params)
+            self._params[0] = params
+        return list(self._callbacks[params is not None])
+
+    def factor(self, params=None, initial_mesh=None):
+        """
+        Solve a linear problem, and keep the factored collocation system
+        for solving it with other right-hand sides.
 
-    guess_func = dummy_guess
+        Parameters
+        ----------
+        params : object, optional
+            As for `Problem.solve`. COLNEW selects the mesh for the
+            problem with these parameters.
+        initial_mesh
+            As for `solve`.
 
-    if isinstance(initial_guess, Solution):
-        if initial_mesh == None:
-            ispace[:len(initial_guess.ispace)] = initial_guess.ispace
-            fspace[:len(initial_guess.fspace)] = initial_guess.fspace
+        Returns
+        -------
+        factorization : Factorization
+            The factored problem. Solve it with `Factorization.solve`.
 
-            ipar[2] = ispace[0]
+        Raises
+        ------
+        ValueError
+            The problem is not linear
+        As for `solve`.
 
-            if coarsen_initial_guess_mesh:
-                ipar[8] = 3
-            else:
-                ipar[8] = 2
-        else:
-            if coarsen_initial_guess_mesh:
+        """
+        if self._ipar[0] != 0:
+            raise ValueError("Only problems with ``is_linear`` can be "
+                             "factored")
+        saved_params = self._params[0]
+        lib = _colnew_enter()
+        try:
+            solution = self._solve(lib, None, params, True, initial_mesh)
+            return Factorization(self, lib, solution, params)
+        finally:
+            self._params[0] = saved_params
+            _colnew_exit(lib)
+
+    def _solve(self, lib, initial_guess, params,
+               coarsen_initial_guess_mesh, initial_mesh):
+        """Solve with `lib`, the copy of COLNEW from `_colnew_enter`"""
+
+        ## Parameters of the user routines
+
+        callbacks = self._bind_params(params)
+
+        ipar = self._ipar.copy()
+        mstar = self.mstar
+        maximum_mesh_size = self.maximum_mesh_size
+
+        ## Initial guess
+
+        native_guess = _lowlevel.capsule(initial_guess)
+        if native_guess is not None and self.is_complex:
+            raise ValueError("Compiled functions cannot be used with "
+                             "``is_complex``")
+
+        def dummy_guess(x): raise ValueError("Invalid initial guess")
+
+        guess_func = dummy_guess
+
+        if isinstance(initial_guess, Solution):
+            if initial_mesh is not None and coarsen_initial_guess_mesh:
                 raise ValueError("Initial mesh and guess both specified: "
                                  "cannot coarsen")
-            n = len(initial_mesh)
-            ispace[n:(n+len(initial_guess.ispace))] = initial_guess.ispace
-            fspace[n:(n+len(initial_guess.fspace))] = initial_guess.fspace
-            ipar[8] = 4
-            ipar[2] = n-1
-    elif callable(initial_guess):
-        ipar[8] = 1
-        guess_func = initial_guess
-    elif initial_guess == None:
-        ipar[8] = 0
-    else:
-        raise ValueError("Unknown initial_guess")
+        elif callable(initial_guess) or native_guess is not None:
+            ipar[8] = 1
+            guess_func = initial_guess
+        elif initial_guess == None:
+            ipar[8] = 0
+        else:
+            raise ValueError("Unknown initial_guess")
 
-    ## Initial mesh
+        ## Initial mesh
 
-    try:
-        ipar[2] = int(initial_mesh) # number of points only
-        ipar[7] = 0
-        initial_mesh = None
-    except (TypeError, ValueError):
-        pass
-
-    if initial_mesh is not None:
-        fspace[:len(initial_mesh)] = initial_mesh
-        ipar[2] = len(initial_mesh) - 1
-        if not adaptive_mesh_selection:
-            ipar[7] = 2
-        else:
-            ipar[7] = 1
-    else:
-        ipar[7] = 0
-        if not adaptive_mesh_selection:
+        try:
+            ipar[2] = int(initial_mesh) # number of points only
+            ipar[7] = 0
+            initial_mesh = None
+        except (TypeError, ValueError):
+            pass
+
+        if initial_mesh is None and not self.adaptive_mesh_selection:
             raise ValueError("Cannot disable mesh selection when no "
                              "initial_mesh given")
 
-    ## Compatibility with non-vectorized functions
-
-    def vectorized_guess(x):
-        us = []
-        dms = []
-        for i, xx in enumerate(x):
-            u, dm = guess_func(float(xx))
-            us.append(u)
-            dms.append(dm)
-        return np.transpose(np.asarray(us)), np.transpose(np.asarray(dms))
-
-    def vectorized_f(x, u):
-        fs = []
-        for i, xx in enumerate(x):
-            fs.append(fsub(float(xx), u[:,i]))
-        return np.transpose(np.asarray(fs))
-
-    def vectorized_df(x, u):
-        dfs = []
-        for i, xx in enumerate(x):
-            dfs.append(dfsub(float(xx), u[:,i]))
-        dfs = np.asarray(dfs)
-        return np.swapaxes(np.swapaxes(dfs, 0, 2), 0, 1)
-
-    if vectorized:
-        vectorized_guess = guess_func
-        vectorized_f = fsub
-        vectorized_df = dfsub
-
-    ## Numerical evaluation of Jacobians, if needed
-
-    def numerical_dg(z):
-        zero = np.zeros([z.shape[0]])
-        # Surprisingly easy: numpy's indexing & broadcasting rocks.
-        # Extra reshape needed for gsubs returning matrices.
-        return _jacobian.jacobian(
-            lambda u: np.reshape(gsub(z + u[:,None]), [mstar]),
-            zero)
-
-    if dgsub == None:
-        dgsub = numerical_dg
-
-    def numerical_df(x, z):
-        zero = np.zeros(z.shape[0])
-        # Extra reshape needed for fsubs returning matrices.
-        df = _jacobian.jacobian(
-            lambda u: np.reshape(vectorized_f(x, z + u[:,None]),
-                                 [ncomp, x.shape[0]]),
-            zero)
-        return np.swapaxes(df, 1, 2) # x-axis comes z-axis
-
-    if dfsub == None:
-        vectorized_df = numerical_df
-
-    ## Call COLNEW
-
-    iflag = _colnew.colnew(
-        degrees,
-        left, right,
-        zeta, ipar, ltol, tol, fixpnt, ispace, fspace,
-        vectorized_f, vectorized_df,
-        gsub, dgsub,
-        vectorized_guess)
-
-    ## Check return value
-
-    if iflag == 1:
-        pass # ok
-    elif iflag == 0:
-        raise _error.SingularCollocationMatrix("Singular collocation matrix "
-                                               "in COLNEW")
-    elif iflag == -1:
-        raise _error.TooManySubintervals("Out of storage space in COLNEW. "
-                                         "Try increasing maximum_mesh_size.")
-    elif iflag == -2:
-        raise _error.NoConvergence("Nonlinear iteration did not converge "
-                                   "in COLNEW")
-    elif iflag == -3:
-        raise ValueError("Invalid input data for COLNEW")
-    else:
-        raise RuntimeError("Unknown error in COLNEW")
+        ## Compatibility with non-vectorized functions
 
-    ## Form the result
+        def vectorized_guess(x):
+            us = []
+            dms = []
+            for i, xx in enumerate(x):
+                u, dm = guess_func(float(xx))
+                us.append(u)
+                dms.append(dm)
+            return np.transpose(np.asarray(us)), np.transpose(np.asarray(dms))
 
-    solution = Solution(ispace, fspace)
+        if self.vectorized:
+            vectorized_guess = guess_func
 
-    ## Return
-    if is_complex:
-        return _complex_adapter.ComplexSolution(solution)
-    else:
-        return solution
+        if native_guess is not None:
+            callbacks.append(native_guess)
+        else:
+            callbacks.append(_filling_guess(vectorized_guess))
+
+        ## Record statistics of the Python callbacks
+
+        stats = SolveStats()
+        for j, name in enumerate(SolveStats._routines):
+            if type(callbacks[j]).__name__ != 'PyCapsule':
+                callbacks[j] = stats._recording(name, callbacks[j])
+        lib.colerr.errest[...] = 0
+        lib.colmem.ialloc[...] = 0
+        lib.colthr.nthr[...] = self._threads
+        stats._lib = lib
+        stats._on_iteration = self._on_iteration
+        stats._on_mesh = self._on_mesh
+
+        ## Allocate work space
+
+        ispace, fspace = self._acquire_workspace(maximum_mesh_size)
+        ipar[4] = len(fspace)
+        ipar[5] = len(ispace)
+
+        try:
+            ## Initial guess and mesh to the workspace
+
+            if isinstance(initial_guess, Solution):
+                if initial_mesh is None:
+                    ispace[:len(initial_guess.ispace)] = initial_guess.ispace
+                    fspace[:len(initial_guess.fspace)] = initial_guess.fspace
+
+                    ipar[2] = ispace[0]
+
+                    if coarsen_initial_guess_mesh:
+                        ipar[8] = 3
+                    else:
+                        ipar[8] = 2
+                else:
+                    n = len(initial_mesh)
+                    ispace[n:(n+len(initial_guess.ispace))] = \
+                        initial_guess.ispace
+                    fspace[n:(n+len(initial_guess.fspace))] = \
+                        initial_guess.fspace
+                    ipar[8] = 4
+                    ipar[2] = n-1
+
+            if initial_mesh is not None:
+                fspace[:len(initial_mesh)] = initial_mesh
+                ipar[2] = len(initial_mesh) - 1
+                if not self.adaptive_mesh_selection:
+                    ipar[7] = 2
+                else:
+                    ipar[7] = 1
+            else:
+                ipar[7] = 0
+
+            ## Call COLNEW
+
+            while True:
+                # kept referenced while COLNEW runs
+                abd_storage = _set_abd_storage(lib, self._abd_groups, mstar,
+                                               maximum_mesh_size)
+                stats._fspace = fspace
+                start = _timer()
+                iflag = lib.colnew(
+                    self.degrees,
+                    self.left, self.right,
+                    self._zeta, ipar, self._ltol, self._tol, self._fixpnt,
+                    ispace, fspace,
+                    *callbacks)
+                stats.fortran_time += _timer() - start
+
+                if iflag != -1 or self.mesh_size_growth is None:
+                    break
+
+                ## Out of space: enlarge the workspace, and continue from
+                ## the last mesh and iterate, which COLNEW leaves in the
+                ## output
+
+                new_size = int(np.ceil(maximum_mesh_size
+                                       * self.mesh_size_growth))
+                if (4*new_size*self._nsizei
+                        + 8*new_size*(self._nsizef + self._nsizeh
+                                      + self._nsizep)
+                        > self.maximum_workspace_size):
+                    break
+
+                last = Solution(ispace, fspace)
+
+                self._release_workspace(maximum_mesh_size, ispace, fspace)
+                ispace = fspace = None
+                maximum_mesh_size = new_size
+                ispace, fspace = self._acquire_workspace(maximum_mesh_size)
+                ipar[4] = len(fspace)
+                ipar[5] = len(ispace)
+
+                if ipar[7] == 2:
+                    # Fixed mesh: keep refining the last mesh
+                    n = last.nmesh
+                    fspace[:n] = last.mesh
+                    ispace[n:(n+len(last.ispace))] = last.ispace
+                    fspace[n:(n+len(last.fspace))] = last.fspace
+                    ipar[2] = n - 1
+                    ipar[8] = 4
+                else:
+                    ispace[:len(last.ispace)] = last.ispace
+                    fspace[:len(last.fspace)] = last.fspace
+                    ipar[2] = ispace[0]
+                    ipar[7] = 0
+                    ipar[8] = 2
+
+            ## Check return value
+
+            if iflag == 1:
+                pass # ok
+            elif iflag == 0:
+                if lib.colmem.ialloc != 0:
+                    raise MemoryError("Out of memory for the values at "
+                                      "the collocation points in COLNEW")
+                raise _error.SingularCollocationMatrix("Singular collocation "
+                                                       "matrix in COLNEW")
+            elif iflag == -1:
+                if self.mesh_size_growth is not None:
+                    raise _error.TooManySubintervals(
+                        "Out of storage space in COLNEW. Try increasing "
+                        "maximum_workspace_size.")
+                raise _error.TooManySubintervals("Out of storage space in "
+                                                 "COLNEW. Try increasing "
+                                                 "maximum_mesh_size.")
+            elif iflag == -2:
+                raise _error.NoConvergence("Nonlinear iteration did not "
+                                           "converge in COLNEW")
+            elif iflag == -3:
+                raise ValueError("Invalid input data for COLNEW")
+            else:
+                raise RuntimeError("Unknown error in COLNEW")
+
+            ## Form the result
+
+            solution = Solution(ispace, fspace)
+            stats.fortran_time -= sum(stats.callback_time.values())
+            stats.error_estimates = np.array(lib.colerr.errest[:mstar])
+            stats._on_iteration = stats._on_mesh = stats._fspace = None
+            stats._lib = None
+            solution.stats = stats
+        finally:
+            if ispace is not None:
+                self._release_workspace(maximum_mesh_size, ispace, fspace)
+
+        ## Return
+        if self.is_complex:
+            return _complex_adapter.ComplexSolution(solution)
+        else:
+            return solution
+
+class Factorization(object):
+    """
+    A linear boundary value problem with its collocation system factored,
+    for solving it with many right-hand sides.
+
+    Made by `Problem.factor`. The right-hand sides are selected with the
+    ``params`` passed to the user routines, as in `Problem.solve`, and
+    each solve costs only evaluating ``fsub`` and ``gsub`` at ``z = 0``
+    and substituting with the stored factors.
+
+    The operator of the problem must be the same for all ``params``:
+    only the inhomogeneous terms, that is, ``fsub`` and ``gsub`` at
+    ``z = 0``, may depend on them, and ``dfsub`` and ``dgsub`` are not
+    called again. All solutions are on the mesh COLNEW selected for
+    the ``params`` given to `Problem.factor`, and the tolerances are not
+    checked for the other right-hand sides.
+
+    Attributes
+    ----------
+    solution : Solution
+        The solution for the ``params`` given to `Problem.factor`.
+    mesh : ndarray
+        The mesh of the factored system.
 
+    """
 
-_colnew_stack = []
-_colnew_depth = 0
-_colnew_commons = [_colnew.colapr, _colnew.colbas, _colnew.colest,
-                   _colnew.colloc, _colnew.colmsh, _colnew.colnln,
-                   _colnew.colord, _colnew.colout, _colnew.colsid]
+    def __init__(self, problem, lib, solution, params):
+        """
+        Factor the system of `problem` on the mesh of `solution`, which
+        the copy `lib` of COLNEW has just solved.
+        """
+        self.problem = problem
+        self.solution = solution
+
+        real_solution = getattr(solution, 'r_solution', solution)
+        self._ispace = real_solution.ispace
+        self._fspace = real_solution.fspace
+
+        n, k, ncomp, mstar = [int(v) for v in self._ispace[:4]]
+        kd = k * ncomp
+        self.mesh = self._fspace[:n+1].copy()
+
+        ## Storage for the factors, as in the workspace of COLNEW
+
+        self._g = np.zeros([4 * mstar * mstar * n])
+        self._w = np.zeros([kd * kd * n])
+        self._v = np.zeros([kd * mstar * n])
+        self._rhs = np.zeros([kd * n + mstar])
+        self._integs = np.zeros([3 * n], np.int32)
+        self._ipvtg = np.zeros([mstar * (n + 1)], np.int32)
+        self._ipvtw = np.zeros([kd * n], np.int32)
+        self._abd_storage = _set_abd_storage(lib, problem._abd_groups,
+                                             mstar, n)
+
+        ## COLNEW left the common blocks for this mesh; keep them
+        lib.colapr.n[...] = n
+        lib.colapr.nz[...] = mstar * (n + 1)
+        lib.colapr.ndmz[...] = kd * n
+        # the factors must be solved with the variant that made them
+        self._nlapck = np.array(lib.collap.nlapck, copy=True)
+
+        self._colslv(lib, 0, params)
+        # after factoring, as the state of the partitioned solver is in
+        # them too
+        self._commons = _colnew_save(lib)
+
+    def solve(self, params):
+        """
+        Solve the problem with the right-hand side given by `params`.
 
-def _colnew_enter():
+        Parameters
+        ----------
+        params : object
+            Passed to the user routines, as in `Problem.solve`.
+
+        Returns
+        -------
+        sol : Solution
+            Object representing the solution.
+
+        Raises
+        ------
+        As for `solve`.
+
+        """
+        return self.solve_many([params])[0]
+
+    def solve_many(self, params):
+        """
+        Solve the problem with a batch of right-hand sides.
+
+        Parameters
+        ----------
+        params : iterable
+            Parameters passed to the user routines, one for each
+            right-hand side.
+
+        Returns
+        -------
+        sols : list of Solution
+            The solutions, in the order of `params`.
+
+        Raises
+        ------
+        As for `solve`.
+
+        """
+        lib = _colnew_enter()
+        try:
+            lib.collap.nlapck[...] = self._nlapck
+            _colnew_restore(lib, self._commons)
+            return [self._colslv(lib, 1, p) for p in params]
+        finally:
+            _colnew_exit(lib)
+
+    def _colslv(self, lib, job, params):
+        """Call COLSLV of `lib`, and form the solution it gives"""
+        problem = self.problem
+        n, k, ncomp, mstar = [int(v) for v in self._ispace[:4]]
+        nz = mstar * (n + 1)
+        ndmz = k * ncomp * n
+
+        def dummy_guess(x): raise ValueError("Invalid initial guess")
+
+        saved_params = problem._params[0]
+        try:
+            callbacks = problem._bind_params(params)
+            callbacks.append(_filling_guess(dummy_guess))
+
+            stats = SolveStats()
+            for j, name in enumerate(SolveStats._routines):
+                if type(callbacks[j]).__name__ != 'PyCapsule':
+                    callbacks[j] = stats._recording(name, callbacks[j])
+            stats._lib = lib
+            lib.colmem.ialloc[...] = 0
+
+            z = np.zeros([nz])
+            dmz = np.zeros([ndmz])
+            start = _timer()
+            msing = lib.colslv(job, self.mesh, z, dmz, self._g, self._w,
+                               self._v, self._rhs, self._integs,
+                               self._ipvtg, self._ipvtw, *callbacks)
+            stats.fortran_time += _timer() - start
+        finally:
+            problem._params[0] = saved_params
+
+        if msing != 0:
+            if lib.colmem.ialloc != 0:
+                raise MemoryError("Out of memory for the values at "
+                                  "the collocation points in COLNEW")
+            raise _error.SingularCollocationMatrix("Singular collocation "
+                                                   "matrix in COLNEW")
+
+        ## The solution of COLNEW, with the new values on the same mesh
+
+        fspace = self._fspace.copy()
+        fspace[n+1:n+1+nz] = z
+        fspace[n+1+nz:n+1+nz+ndmz] = dmz
+        solution = Solution(self._ispace, fspace)
+        stats.fortran_time -= sum(stats.callback_time.values())
+        stats.error_estimates = np.zeros([mstar])
+        stats._lib = None
+        solution.stats = stats
+
+        if problem.is_complex:
+            return _complex_adapter.ComplexSolution(solution)
+        else:
+            return solution
+
+def prepare(boundary_points, degrees, fsub, gsub, **kw):
     """
-    Push old COLNEW data to stack.
+    Prepare a boundary value problem for repeated solving.
 
-    Colnew itself is written in Fortran using COMMON blocks,
-    and so it is not reentrant. We make it reentrant by manually
-    pushing and popping the COMMON contents on and off a stack.
+    Same as ``Problem(boundary_points, degrees, fsub, gsub, **kw)``.
+
+    Returns
+    -------
+    problem : Problem
+        The prepared problem. Solve it with `Problem.solve`.
 
     """
-    global _colnew_stack, _colnew_depth, _colnew_commons
+    return Problem(boundary_points, degrees, fsub, gsub, **kw)
 
-    _colnew_depth += 1
-    if _colnew_depth == 1:
-        return # nothing needs to be done yet
 
-    stack_entry = []
-    for j, com in enumerate(_colnew_commons):
-        stack_sub = {}
-        for name in com.__dict__.keys():
-            stack_sub[name] = np.array(getattr(com, name), copy=True)
-        stack_entry.append(stack_sub)
-    _colnew_stack.append(stack_entry)
+class _ColnewInstances(object):
+    """
+    Pool of separately loaded copies of the `_colnew` extension module.
+
+    Colnew itself is written in Fortran using COMMON blocks, so it is
+    neither reentrant nor thread-safe. Its state is, however, in the
+    data of the loaded extension, and a copy of the extension loaded
+    from a copy of its file has a state of its own. Each solve takes a
+    copy no other solve is using, and returns it when done. Solves in
+    different threads therefore run independently of each other, and
+    nested solves (from inside the user routines) get a copy of their
+    own, so that the state of the solve around them needs no saving.
+    New copies are loaded when all are in use.
 
-def _colnew_exit():
     """
-    Pop old COLNEW data from stack.
+
+    def __init__(self, module):
+        self.module = module
+        self.idle = [module]
+        self.count = 1
+        self.directory = None
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        with self.lock:
+            if self.idle:
+                return self.idle.pop()
+            self.count += 1
+            number = self.count
+            if self.directory is None:
+                self.directory = tempfile.mkdtemp(prefix='bvp1lg-')
+                atexit.register(shutil.rmtree, self.directory, True)
+        return self._load(number)
+
+    def release(self, lib):
+        with self.lock:
+            self.idle.append(lib)
+
+    def _load(self, number):
+        """Load a copy of the module from a copy of its file"""
+        directory = os.path.join(self.directory, str(number))
+        os.mkdir(directory)
+        filename = os.path.join(directory,
+                                os.path.basename(self.module.__file__))
+        shutil.copyfile(self.module.__file__, filename)
+        spec = importlib.util.spec_from_file_location(self.module.__name__,
+                                                      filename)
+        lib = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(lib)
+        return lib
+
+_colnew_instances = _ColnewInstances(_colnew)
+_colnew_commons = ['colapr', 'colbas', 'colest', 'colloc', 'colmsh',
+                   'colnln', 'colord', 'colout', 'colsid', 'colerr',
+                   'colitr', 'colmem', 'colthr', 'colpab']
+
+def _colnew_enter():
     """
-    global _colnew_stack, _colnew_depth, _colnew_commons
+    Acquire a copy of COLNEW for a solve, see `_ColnewInstances`.
+    """
+    lib = _colnew_instances.acquire()
+    # the factors of the blocks depend on it, fix it for the solve
+    lib.collap.nlapck[...] = _lapack_threshold
+    return lib
 
-    _colnew_depth -= 1
-    if _colnew_depth == 0:
-        return # nothing needs to be done
+def _colnew_exit(lib):
+    """
+    Release the copy of COLNEW from `_colnew_enter`.
+    """
+    _colnew_instances.release(lib)
 
-    entry = _colnew_stack.pop()
-    for com, sub in zip(_colnew_commons, entry):
+def _set_abd_storage(lib, groups, mstar, nmax):
+    """
+    Allocate the arrays for the factors of the partitioned ABD solver of
+    COLNEW (lib/colpab.f), with `groups` groups for meshes of up to
+    `nmax` subintervals, and point the COLNEW copy `lib` to them. The
+    solver is turned off if `groups` is 0. The arrays are returned, and
+    must be kept alive while COLNEW uses them.
+    """
+    com = lib.colpab
+    com.ipabok[...] = 0
+    if not groups:
+        com.npabd[...] = 0
+        com.ipabf[...] = com.ipabi[...] = 0
+        com.lpabf[...] = com.lpabi[...] = 0
+        return None
+
+    # bounds for the layout set up by pablay
+    p = min(groups, nmax)
+    fstore = np.empty([5*mstar*mstar*nmax + 4*mstar*mstar*p + 2*mstar],
+                      np.float64)
+    istore = np.empty([3 + (5 + mstar)*nmax + 8*p + (p + 1)*mstar],
+                      np.int32)
+    com.npabd[...] = groups
+    com.ipabf[...] = fstore.ctypes.data
+    com.ipabi[...] = istore.ctypes.data
+    com.lpabf[...] = len(fstore)
+    com.lpabi[...] = len(istore)
+    return fstore, istore
+
+def _colnew_save(lib):
+    """Copy the COLNEW data in the COMMON blocks of `lib`"""
+    entry = []
+    for block in _colnew_commons:
+        com = getattr(lib, block)
+        sub = {}
+        for name in com.__dict__.keys():
+            sub[name] = np.array(getattr(com, name), copy=True)
+        entry.append(sub)
+    return entry
+
+def _colnew_restore(lib, entry):
+    """Restore COLNEW data copied by `_colnew_save` to `lib`"""
+    for block, sub in zip(_colnew_commons, entry):
+        com = getattr(lib, block)
         for name in com.__dict__.keys():
             getattr(com, name)[...] = sub[name]
 
+class _WorkspacePool(object):
+    """
+    Pool of COLNEW workspace arrays, reused across calls to `solve`.
+
+    Idle ``(ispace, fspace)`` pairs are kept keyed by
+    ``(ncomp, mstar, collocation_points, maximum_mesh_size)``, and the
+    least recently used ones are dropped when their total size exceeds
+    the byte budget. A pair is removed from the pool while in use, so
+    that nested solves get separate arrays.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.nbytes = 0
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def acquire(self, key, nispace, nfspace):
+        with self.lock:
+            entries = self.entries.get(key)
+            if entries:
+                ispace, fspace = entries.pop()
+                if not entries:
+                    del self.entries[key]
+                self.nbytes -= ispace.nbytes + fspace.nbytes
+                return ispace, fspace
+        return (np.empty([nispace], np.int32),
+                np.empty([nfspace], np.float64))
+
+    def release(self, key, ispace, fspace):
+        with self.lock:
+            entries = self.entries.pop(key, [])
+            entries.append((ispace, fspace))
+            self.entries[key] = entries
+            self.nbytes += ispace.nbytes + fspace.nbytes
+            self._evict()
+
+    def resize(self, size):
+        with self.lock:
+            old_size, self.size = self.size, size
+            self._evict()
+            return old_size
+
+    def _evict(self):
+        while self.nbytes > self.size:
+            key, entries = next(iter(self.entries.items()))
+            ispace, fspace = entries.pop(0)
+            if not entries:
+                del self.entries[key]
+            self.nbytes -= ispace.nbytes + fspace.nbytes
+
+_workspace_pool = _WorkspacePool(2**25)
+
+def set_workspace_pool_size(size):
+    """
+    Set the size of the pool of COLNEW workspace arrays.
+
+    `solve` keeps the workspace arrays of finished solves, and reuses
+    them in later solves of problems of the same shape and with the
+    same ``collocation_points`` and ``maximum_mesh_size``. This saves
+    allocating the arrays anew in sweeps over many small problems.
+
+    Parameters
+    ----------
+    size : int
+        Maximum total size of the kept arrays, in bytes.
+        0 disables the pool. The default is 32 MB.
+
+    Returns
+    -------
+    old_size : int
+        The previous size.
+    """
+    return _workspace_pool.resize(int(size))
+
+_lapack_threshold = 24
+
+def set_lapack_threshold(order):
+    """
+    Set the smallest collocation block that COLNEW factors with LAPACK.
+
+    COLNEW condenses the collocation equations of each subinterval by
+    factoring a block of order ``ncomp * k``, where ``k`` is the number
+    of collocation points. Blocks of order `order` and larger are
+    factored with LAPACK, using the optimized BLAS scikits.bvp1lg was
+    built with, and smaller ones with the bundled LINPACK routines,
+    which have less overhead. ``benchmarks/lapack_blocks.py`` finds the
+    crossover for a given machine.
+
+    Parameters
+    ----------
+    order : int or None
+        Smallest order of the blocks to factor with LAPACK. 0 uses
+        LAPACK for all blocks, and None for none. The default is 24.
+
+    Returns
+    -------
+    old_order : int or None
+        The previous value.
+
+    Notes
+    -----
+    The new value is used from the next solve that is not nested in
+    another one. If scikits.bvp1lg was built without LAPACK, LINPACK is
+    used for all blocks.
+    """
+    global _lapack_threshold
+    old_order = _lapack_threshold
+    if order is None:
+        _lapack_threshold = 2**31 - 1
+    else:
+        _lapack_threshold = max(0, min(int(order), 2**31 - 1))
+    if old_order == 2**31 - 1:
+        return None
+    return old_order
+
 def check_jacobians(boundary_points, degrees, fsub, gsub, dfsub, dgsub,
                     vectorized=True, **kw):
     """
@@ -173,7 +173,7 @@ class ComplexAdapter(object):
         return r_dg
 
     def __init__(self, boundary_points, degrees, fsub, gsub,
-                 dfsub=None, dgsub=None, tolerances=None):
+                 dfsub=None, dgsub=None, tolerances=None, jac_sparsity=None):
         self.c_fsub = fsub
         self.c_gsub = gsub 
         self.c_dfsub = dfsub
@@ -196,6 +196,13 @@ class ComplexAdapter(object):
 
         self.boundary_points = np.repeat(boundary_points, 2)
 
+        # Real and imaginary parts couple to each other
+        if jac_sparsity is not None:
+            s = np.asarray(jac_sparsity, dtype=bool)
+            self.jac_sparsity = np.block([[s, s], [s, s]])
+        else:
+            self.jac_sparsity = None
+
 class ComplexSolution(object):
     """
     Convert a real solution of a complex-valued problem to complex-valued
@@ -206,10 +213,34 @@ class ComplexSolution(object):
     def __init__(self, solution):
         self.r_solution = solution
 
-    def __call__(self, x):
-        r = self.r_solution.__call__(x)
-        m = r.shape[1]//2
-        return r[:,:m] + 1j*r[:,m:]
+    def __call__(self, x, components=None, chunk_size=None):
+        if components is None:
+            r = self.r_solution.__call__(x, chunk_size=chunk_size)
+            m = r.shape[-1]//2
+        else:
+            m = len(components)
+            components = np.r_[components, np.asarray(components)
+                               + self.r_solution.mstar//2]
+            r = self.r_solution.__call__(x, components=components,
+                                         chunk_size=chunk_size)
+        return r[...,:m] + 1j*r[...,m:]
+
+    def to_ppoly(self):
+        ## Postponed import -- soft dependency on Scipy only
+        import scipy.interpolate as _interpolate
+
+        c = self.r_solution._get_coefficients()
+        m = c.shape[2]//2
+        return _interpolate.PPoly(c[:,:,:m] + 1j*c[:,:,m:],
+                                  self.r_solution.mesh.copy())
+
+    def save(self, filename):
+        ## Postponed import -- avoid a circular import
+        from . import colnew as _colnew
+        _colnew.save_solutions(filename, [self])
 
     def __getattr__(self, name):
+        if name == 'r_solution':
+            # not yet initialized, e.g. when unpickling
+            raise AttributeError(name)
         return getattr(self.r_solution, name)
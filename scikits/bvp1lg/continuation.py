@@ -0,0 +1,505 @@
+# Author: Pauli Virtanen <pav@iki.fi>, 2006.
+# All rights reserved. See LICENSE.txt.
+r"""
+continuation
+============
+
+Follow solutions of parameter-dependent boundary value problems
+
+- `solve`: Pseudo-arclength continuation on top of `colnew.solve`
+
+.. seealso:: `scikits.bvp1lg.colnew`
+
+Description
+-----------
+
+Solving a difficult boundary value problem often requires continuation:
+the problem is solved for a sequence of parameter values, starting
+from an easy one, each time using the previous solution as the initial
+guess. Choosing the parameter steps by hand is tedious, and simple
+continuation in the parameter fails at folds, where the solution
+branch turns back.
+
+This module follows the solution branch with pseudo-arclength
+continuation [AG]_. The problem
+
+.. math::
+
+    u_i^{(m_i)}(x) = f_i(x, z(x), p)
+
+    g_j(\zeta_j, z(\zeta_j), p) = 0
+
+is augmented with the parameter :math:`p` and an arclength integral
+:math:`w` as additional unknowns:
+
+.. math::
+
+    p'(x) = 0
+
+    w'(x) = \dot{z}(x) \cdot (z(x) - z_0(x)) / (b - a)
+
+    w(a) = 0
+
+    w(b) + \dot{p} (p - p_0) = \Delta s
+
+where :math:`(z_0, p_0)` is the previous point on the branch and
+:math:`(\dot{z}, \dot{p})` the (secant) tangent of the branch there.
+The augmented problem is solved with COLNEW, starting from the tangent
+predictor :math:`(z_0 + \Delta s\,\dot{z}, p_0 + \Delta s\,\dot{p})`
+on the previous mesh. The step :math:`\Delta s` is cut when COLNEW
+fails to converge, and grown after successful steps.
+
+References
+----------
+
+.. [AG] E. L. Allgower and K. Georg, Introduction to Numerical
+        Continuation Methods. SIAM (2003).
+
+Module contents
+---------------
+"""
+from __future__ import absolute_import, division, print_function
+
+import numpy as np
+from . import colnew as _colnew
+from . import error as _error
+
+def solve(boundary_points, degrees, fsub, gsub, parameter_range,
+          dfsub=None, dgsub=None,
+          initial_guess=None,
+          initial_step=None,
+          minimum_step=None,
+          maximum_step=None,
+          step_growth=1.5,
+          maximum_steps=1000,
+          coarsen_initial_guess_mesh=True,
+          **kw):
+    r"""
+    Follow the solution of a boundary value problem along a parameter.
+
+    Parameters
+    ----------
+    boundary_points, degrees
+        As for `colnew.solve`.
+    fsub : callable
+        Function ``f``, given as ``def fsub(x, z, p): return f``, where
+        ``p`` is the (scalar) parameter and the rest are as for
+        `colnew.solve`. It must be vectorized.
+    gsub : callable
+        Function ``g``, given as ``def gsub(z, p): return g``.
+        Otherwise as for `colnew.solve`.
+    parameter_range : (float, float)
+        The initial and the final value of the parameter.
+    dfsub : callable, optional
+        Jacobian of ``f`` with respect to ``z``, given as
+        ``def dfsub(x, z, p): return df``. If None, a difference
+        approximation is used. The derivative with respect to ``p`` is
+        always computed by differences.
+    dgsub : callable, optional
+        Jacobian of ``g`` with respect to ``z``, given as
+        ``def dgsub(z, p): return dg``. If None, a difference
+        approximation is used.
+    initial_guess : callable or Solution, optional
+        Initial guess for the problem at the initial parameter value,
+        as for `colnew.solve`.
+    initial_step : float, optional
+        Initial step size. The second point on the branch is found by
+        stepping the parameter by this amount, so it should be small
+        enough for the previous solution to be a good initial guess.
+        If None, 1/1000 of the parameter range.
+    minimum_step : float, optional
+        Smallest allowed step size. If the step must be cut below this,
+        `scikits.bvp1lg.NoConvergence` is raised. If None, 1e-6 times
+        the parameter range.
+    maximum_step : float, optional
+        Largest allowed step size. If None, 1/4 of the parameter range.
+    step_growth : float, optional
+        Factor by which the step size is increased after a successful
+        step.
+    maximum_steps : int, optional
+        Maximum number of continuation steps. The continuation stops
+        when it is reached, even if the final parameter value was not.
+    coarsen_initial_guess_mesh : bool, optional
+        Whether to coarsen the mesh of the previous solution before
+        using it as the initial mesh for the next step.
+    **kw
+        Additional keyword arguments passed on to `colnew.solve`.
+        ``tolerances``, if given, apply to the components of ``z``.
+
+    Returns
+    -------
+    params : ndarray
+        Parameter values along the solution branch.
+    solutions : list of Solution
+        Solutions for the corresponding parameter values.
+        After a fold, the parameter values need not be monotonic.
+
+    Raises
+    ------
+    scikits.bvp1lg.NoConvergence
+        If the step size had to be cut below ``minimum_step``.
+    ValueError
+        Invalid input
+
+    Examples
+    --------
+    Follow the Bratu problem ``u'' + p exp(u) = 0``, ``u(0) = u(1) = 0``
+    around its fold at ``p = 3.51...``:
+
+    >>> def fsub(x, z, p):
+    ...     return -p * np.exp(z[:1])
+    >>> def gsub(z, p):
+    ...     return np.array([z[0,0], z[0,1]])
+    >>> params, solutions = solve([0, 1], [2], fsub, gsub, (0.5, 5),
+    ...                           maximum_steps=20, tolerances=[1e-6, 1e-6],
+    ...                           maximum_mesh_size=300)
+    >>> bool(params.max() < 3.514)     # the fold is not passed in p...
+    True
+    >>> bool(params[-1] < params.max())  # ...but the branch turns back
+    True
+
+    """
+    kw = dict(kw)
+    if not kw.get('vectorized', True):
+        raise ValueError("Continuation requires vectorized functions")
+    if kw.get('is_complex', False):
+        raise ValueError("Continuation of complex problems is not supported")
+    if kw.get('fdfsub') is not None:
+        raise ValueError("Continuation requires separate fsub and dfsub")
+    if kw.get('inplace', False):
+        raise ValueError("Continuation does not support in-place functions")
+
+    p_start, p_end = [float(p) for p in parameter_range]
+    span = abs(p_end - p_start)
+    if span == 0:
+        raise ValueError("Empty parameter range")
+    direction = np.sign(p_end - p_start)
+
+    if initial_step is None:
+        initial_step = span / 1000
+    if minimum_step is None:
+        minimum_step = span * 1e-6
+    if maximum_step is None:
+        maximum_step = span / 4
+
+    if kw.get('left') is None:
+        kw['left'] = min(boundary_points)
+    if kw.get('right') is None:
+        kw['right'] = max(boundary_points)
+
+    problem = _AugmentedProblem(boundary_points, degrees, fsub, gsub,
+                                dfsub, dgsub, kw)
+
+    fixed_points = (list(boundary_points)
+                    + list(kw.get('extra_fixed_points') or []))
+
+    ## Natural continuation for the first two points
+
+    params = [p_start]
+    solutions = [problem.solve_natural(p_start, initial_guess)]
+
+    step = initial_step
+    while True:
+        p = p_start + direction * step
+        try:
+            solution = problem.solve_natural(p, solutions[0],
+                                             initial_mesh=None)
+            break
+        except _error.NoConvergence:
+            step = _cut_step(step, minimum_step)
+
+    params.append(p)
+    solutions.append(solution)
+
+    ## Pseudo-arclength continuation
+
+    step = min(step * step_growth, maximum_step)
+    nsteps = 1
+
+    while (params[-1] - p_end) * direction < 0 and nsteps < maximum_steps:
+        mesh = solutions[-1].mesh
+        if coarsen_initial_guess_mesh:
+            mesh = _coarsen_mesh(mesh, fixed_points)
+
+        problem.set_tangent(params[-2], solutions[-2],
+                            params[-1], solutions[-1], mesh)
+
+        try:
+            p, solution = problem.solve_corrector(step, mesh)
+        except _error.NoConvergence:
+            step = _cut_step(step, minimum_step)
+            continue
+
+        params.append(p)
+        solutions.append(solution)
+        nsteps += 1
+
+        step = min(step * step_growth, maximum_step)
+
+    ## Land exactly on the final parameter value
+
+    if (params[-1] - p_end) * direction > 0:
+        p0, p1 = params[-2:]
+        sol0, sol1 = solutions[-2:]
+        theta = (p_end - p0) / (p1 - p0)
+
+        def guess(x):
+            z = (1 - theta) * sol0(x).T + theta * sol1(x).T
+            return z, problem.fsub(x, z, p_end)
+
+        solution = problem.solve_natural(p_end, guess,
+                                         initial_mesh=sol1.mesh)
+        params[-1] = p_end
+        solutions[-1] = solution
+
+    return np.array(params), solutions
+
+def _cut_step(step, minimum_step):
+    """
+    Halve the step size, or give up.
+    """
+    step = step / 2
+    if step < minimum_step:
+        raise _error.NoConvergence("Continuation step size became too "
+                                   "small")
+    return step
+
+def _coarsen_mesh(mesh, fixed_points):
+    """
+    Drop every other mesh point, keeping the end points and fixed points.
+    """
+    coarse = list(mesh[::2]) + [mesh[-1]]
+    coarse += [x for x in fixed_points if mesh[0] < x < mesh[-1]]
+    return np.unique(np.asarray(coarse, np.float64))
+
+def _quadrature(mesh):
+    """
+    Gauss-Legendre nodes and weights on each subinterval of the mesh.
+    """
+    s, w = np.polynomial.legendre.leggauss(3)
+    h = np.diff(mesh)
+    x = mesh[:-1,None] + h[:,None] * (1 + s[None,:]) / 2
+    w = h[:,None] * w[None,:] / 2
+    return x.ravel(), w.ravel()
+
+class _AugmentedProblem(object):
+    """
+    The natural and the arclength-augmented problems for `solve`.
+    """
+
+    def __init__(self, boundary_points, degrees, fsub, gsub,
+                 dfsub, dgsub, kw):
+        self.boundary_points = list(boundary_points)
+        self.degrees = list(degrees)
+        self.fsub = fsub
+        self.gsub = gsub
+        self.dfsub = dfsub
+        self.dgsub = dgsub
+        self.kw = kw
+
+        self.ncomp = len(self.degrees)
+        self.mstar = int(sum(self.degrees))
+        self.left = kw['left']
+        self.right = kw['right']
+        self.length = self.right - self.left
+
+        tolerances = kw.get('tolerances')
+        if tolerances is not None:
+            self.aug_tolerances = list(tolerances) + [0, 0]
+        else:
+            self.aug_tolerances = None
+
+        # The parameter enters all equations; the arclength equation
+        # depends on all of z
+        sparsity = kw.get('jac_sparsity')
+        if sparsity is not None:
+            self.aug_sparsity = np.zeros([self.ncomp + 2, self.mstar + 2],
+                                         dtype=bool)
+            self.aug_sparsity[:self.ncomp,:self.mstar] = sparsity
+            self.aug_sparsity[:self.ncomp,self.mstar] = True
+            self.aug_sparsity[self.ncomp+1,:self.mstar] = True
+        else:
+            self.aug_sparsity = None
+
+        self._cache_x = None
+
+    def _parameter_step(self, p):
+        return 1e-7 * max(abs(p), 1)
+
+    ## Natural problem
+
+    def solve_natural(self, p, initial_guess, **kw):
+        """
+        Solve the problem for a fixed parameter value.
+        """
+        def fsub(x, z):
+            return self.fsub(x, z, p)
+        def gsub(z):
+            return self.gsub(z, p)
+
+        dfsub = dgsub = None
+        if self.dfsub is not None:
+            def dfsub(x, z):
+                return self.dfsub(x, z, p)
+        if self.dgsub is not None:
+            def dgsub(z):
+                return self.dgsub(z, p)
+
+        args = dict(self.kw)
+        args.update(kw)
+        args['initial_guess'] = initial_guess
+        return _colnew.solve(self.boundary_points, self.degrees, fsub, gsub,
+                             dfsub=dfsub, dgsub=dgsub, **args)
+
+    ## Tangent
+
+    def set_tangent(self, p0, sol0, p1, sol1, mesh):
+        """
+        Use the secant through (p0, sol0) and (p1, sol1) as the tangent.
+        """
+        x, w = _quadrature(mesh)
+        dz = sol1(x).T - sol0(x).T
+        dp = p1 - p0
+        norm = np.sqrt((w * (dz**2).sum(axis=0)).sum() / self.length
+                       + dp**2)
+
+        self.p0 = p1
+        self.sol0 = sol1
+        self.p_dot = dp / norm
+        self.z_dot = lambda x: (sol1(x).T - sol0(x).T) / norm
+        self._cache_x = None
+
+    def _branch(self, x):
+        """
+        Evaluate the previous solution and the tangent at ``x``.
+        """
+        # The same points are evaluated several times in a row
+        if self._cache_x is None or not np.array_equal(self._cache_x, x):
+            self._cache_x = np.array(x, copy=True)
+            self._cache_values = (self.sol0(x).T, self.z_dot(x))
+        return self._cache_values
+
+    ## Augmented problem
+
+    def aug_fsub(self, x, z):
+        mstar, ncomp = self.mstar, self.ncomp
+        z0, z_dot = self._branch(x)
+
+        # The parameter is constant in x, except when the numerical
+        # partial derivatives perturb it at some points only
+        f = np.empty([ncomp, len(x)], dtype=np.result_type(z, float))
+        for p in np.unique(z[mstar]):
+            idx = (z[mstar] == p)
+            f[:,idx] = np.reshape(self.fsub(x[idx], z[:mstar,idx], p),
+                                  [ncomp, idx.sum()])
+
+        return np.vstack([
+            f,
+            np.zeros([1, len(x)]),
+            (z_dot * (z[:mstar] - z0)).sum(axis=0)[None,:] / self.length])
+
+    def aug_dfsub(self, x, z):
+        mstar, ncomp = self.mstar, self.ncomp
+        p = z[mstar,0]
+        zz = z[:mstar]
+        z0, z_dot = self._branch(x)
+
+        df = np.zeros([ncomp + 2, mstar + 2, len(x)])
+        df[:ncomp,:mstar] = np.reshape(self.dfsub(x, zz, p),
+                                       [ncomp, mstar, len(x)])
+        h = self._parameter_step(p)
+        df[:ncomp,mstar] = (
+            np.reshape(self.fsub(x, zz, p + h), [ncomp, len(x)])
+            - np.reshape(self.fsub(x, zz, p), [ncomp, len(x)])) / h
+        df[ncomp+1,:mstar] = z_dot / self.length
+        return df
+
+    def aug_gsub(self, z):
+        mstar = self.mstar
+        g = np.empty([mstar + 2], dtype=np.result_type(z, float))
+        g[0] = z[mstar+1,0]
+        g[1:mstar+1] = np.reshape(self.gsub(z[:mstar,1:mstar+1], z[mstar,1]),
+                                  [mstar])
+        g[mstar+1] = (z[mstar+1,mstar+1] + self.p_dot * (z[mstar,mstar+1]
+                                                         - self.p0)
+                      - self.step)
+        return g
+
+    def aug_dgsub(self, z):
+        mstar = self.mstar
+        zz = z[:mstar,1:mstar+1]
+        p = z[mstar,1]
+
+        dg = np.zeros([mstar + 2, mstar + 2])
+        dg[0,mstar+1] = 1
+        dg[1:mstar+1,:mstar] = self.dgsub(zz, p)
+        h = self._parameter_step(p)
+        dg[1:mstar+1,mstar] = (np.reshape(self.gsub(zz, p + h), [mstar])
+                               - np.reshape(self.gsub(zz, p), [mstar])) / h
+        dg[mstar+1,mstar] = self.p_dot
+        dg[mstar+1,mstar+1] = 1
+        return dg
+
+    def solve_corrector(self, step, mesh):
+        """
+        Take a pseudo-arclength step of the given size.
+
+        Returns
+        -------
+        p : float
+            The new parameter value
+        solution : Solution
+            The new solution of the original problem
+        """
+        mstar = self.mstar
+        self.step = step
+        p_pred = self.p0 + step * self.p_dot
+
+        def guess(x):
+            z0, z_dot = self._branch(x)
+            z = np.empty([mstar + 2, len(x)])
+            z[:mstar] = z0 + step * z_dot
+            z[mstar] = p_pred
+            z[mstar+1] = 0
+            return z, self.aug_fsub(x, z)
+
+        zeta = [self.left] + self.boundary_points + [self.right]
+        degrees = self.degrees + [1, 1]
+
+        args = dict(self.kw)
+        args.update(initial_guess=guess, initial_mesh=mesh,
+                    tolerances=self.aug_tolerances, is_linear=False,
+                    jac_sparsity=self.aug_sparsity)
+
+        aug_solution = _colnew.solve(
+            zeta, degrees, self.aug_fsub, self.aug_gsub,
+            dfsub=self.aug_dfsub if self.dfsub is not None else None,
+            dgsub=self.aug_dgsub if self.dgsub is not None else None,
+            **args)
+
+        p = float(aug_solution(self.left)[mstar])
+        solution = _drop_components(aug_solution, self.ncomp)
+
+        # Guard against jumping to another branch: the corrector should
+        # stay within a step's distance of the predictor.
+        x, w = _quadrature(aug_solution.mesh)
+        z0, z_dot = self.sol0(x).T, self.z_dot(x)
+        dz = solution(x).T - (z0 + step * z_dot)
+        dist = np.sqrt((w * (dz**2).sum(axis=0)).sum() / self.length
+                       + (p - p_pred)**2)
+        if dist > step:
+            raise _error.NoConvergence("Continuation corrector left the "
+                                       "solution branch")
+
+        return p, solution
+
+def _drop_components(solution, ncomp):
+    """
+    Form a Solution containing only the first `ncomp` components.
+    """
+    degrees = [int(v) for v in solution.ispace[7:7+ncomp]]
+    mstar = sum(degrees)
+    mesh, z, dmz, coef = _colnew._unpack(solution.ispace, solution.fspace)
+    ispace, fspace = _colnew._pack(mesh, z[:,:mstar], dmz[:,:,:ncomp], coef,
+                                   degrees)
+    return _colnew.Solution(ispace, fspace)
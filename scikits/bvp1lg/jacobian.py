@@ -13,16 +13,36 @@ from __future__ import absolute_import, division, print_function
 
 import numpy as np
 
-def jacobian(f, u, eps=1e-6):
+def jacobian(f, u, eps=1e-6, method='forward'):
     r"""Evaluate partial derivatives of f(u) numerically.
 
     .. note:: This routine is currently naive and could be improved.
 
+    Parameters
+    ----------
+    f
+        Function to differentiate
+    u
+        Point where to evaluate the derivatives
+    eps
+        Relative step for forward differences
+    method : {'forward', 'complex'}
+        'forward' uses one-sided differences with steps
+        ``max(eps*abs(u_k), eps)``. 'complex' uses the complex step
+        ``Im f(u + i h e_k) / h``, which is accurate to rounding error,
+        but requires a real `u` and that `f` is real-analytic and
+        accepts complex arguments.
+
     Returns
     -------
     df : ndarray
         (\*f.shape, \*u.shape) array ``df``, where df[i,j] ~= (d f_i / u_j)(u)
     """
+    if method == 'complex':
+        return _complex_step_jacobian(f, u)
+    elif method != 'forward':
+        raise ValueError("Unknown method %r" % (method,))
+
     f0 = np.asarray(f(u)) # asarray: because of matrices
 
     u_shape = u.shape
@@ -37,11 +57,168 @@ def jacobian(f, u, eps=1e-6):
         du = np.zeros(nu, dtype=u.dtype)
         du[k] = max(eps*abs(u.flat[k]), eps)
         f1 = np.asarray(f(u + np.reshape(du, u_shape)))
-        df[:,k] = np.reshape((f1 - f0) / eps, [nf])
+        df[:,k] = np.reshape((f1 - f0) / du[k], [nf])
 
     df.shape = f_shape + u_shape
     return df
 
+_COMPLEX_STEP = 1e-20
+
+def _complex_step_jacobian(f, u):
+    u = np.asarray(u)
+    if np.iscomplexobj(u):
+        raise ValueError("Complex-step differentiation requires real u")
+
+    u_shape = u.shape
+    nu = int(np.prod(u_shape))
+    df = None
+
+    for k in range(nu):
+        du = np.zeros(nu, dtype=complex)
+        du[k] = 1j * _COMPLEX_STEP
+        f1 = np.asarray(f(u + np.reshape(du, u_shape)))
+        if df is None:
+            f_shape = f1.shape
+            df = np.empty([int(np.prod(f_shape)), nu])
+        df[:,k] = np.reshape(f1.imag / _COMPLEX_STEP, [-1])
+
+    if df is None:
+        f_shape = np.asarray(f(u)).shape
+        df = np.empty([int(np.prod(f_shape)), 0])
+    df.shape = f_shape + u_shape
+    return df
+
+def color_columns(sparsity):
+    r"""Group the columns of a sparse Jacobian for finite differences.
+
+    Columns in the same group have no nonzero rows in common, so they
+    can be perturbed together (Curtis, Powell and Reid). The columns
+    are assigned greedily, in order of decreasing number of nonzeros.
+
+    Parameters
+    ----------
+    sparsity
+        (nf, nu) boolean array, True where ``df[i,j]`` may be nonzero
+
+    Returns
+    -------
+    colors : ndarray of int
+        (nu,) array of the group of each column, numbered from 0
+
+    Examples
+    --------
+    >>> color_columns([[1, 0, 0], [0, 1, 1], [1, 0, 0]])
+    array([0, 0, 1])
+    """
+    sparsity = np.asarray(sparsity, dtype=bool)
+    nu = sparsity.shape[1]
+    colors = np.zeros([nu], dtype=int)
+    used = []
+    for j in np.argsort(-sparsity.sum(axis=0), kind='mergesort'):
+        for c, rows in enumerate(used):
+            if not np.any(rows & sparsity[:,j]):
+                rows |= sparsity[:,j]
+                break
+        else:
+            c = len(used)
+            used.append(sparsity[:,j].copy())
+        colors[j] = c
+    return colors
+
+def local_jacobian(f, x, z, eps=1e-6, chunk_size=None, sparsity=None,
+                   method='forward', f0=None):
+    r"""Evaluate partial derivatives of a pointwise function numerically.
+
+    For functions ``f(x, z)`` whose ``f(x, z)[:,k]`` depends only on
+    ``x[k]`` and ``z[:,k]``. All the perturbed ``z`` are stacked
+    side by side, so that ``f`` is called once per chunk of points
+    instead of once per component of ``z``.
+
+    Parameters
+    ----------
+    f
+        f(x, z) should return array(nf, nx) for x=array(nx),
+        z=array(nz, nx)
+    x, z
+        Point where to evaluate the derivatives
+    eps
+        epsilon to use for evaluating the partial derivatives
+    chunk_size
+        Maximum number of points to pass to ``f`` in a single call.
+        The default bounds the stacked ``z`` to about 2**22 elements.
+    sparsity
+        (nf, nz) boolean array, True where ``df[i,j]`` may be nonzero.
+        If given, structurally independent components are perturbed
+        together (see `color_columns`), and the other entries are zero.
+    method : {'forward', 'complex'}
+        Forward differences with step `eps`, or complex steps,
+        as in `jacobian`.
+    f0
+        ``f(x, z)``, if already known. Saves evaluating ``f`` at the
+        unperturbed points for forward differences.
+
+    Returns
+    -------
+    df : ndarray
+        (nf, nz, nx) array ``df``, where
+        df[i,j,k] ~= (d f_i / z_j)(x[k], z[:,k])
+    """
+    if method not in ('forward', 'complex'):
+        raise ValueError("Unknown method %r" % (method,))
+    x = np.asarray(x)
+    z = np.asarray(z)
+    if method == 'complex' and np.iscomplexobj(z):
+        raise ValueError("Complex-step differentiation requires real z")
+    nz, nx = z.shape
+    if sparsity is None:
+        colors = np.arange(nz)
+    else:
+        sparsity = np.asarray(sparsity, dtype=bool)
+        colors = color_columns(sparsity)
+    ngroups = int(colors.max()) + 1 if nz else 0
+    if chunk_size is None:
+        chunk_size = max(2**22 // max(nz, 1), ngroups + 1)
+
+    # Points per call: each point comes with its perturbations
+    step = max(chunk_size // (ngroups + 1), 1)
+    df = None
+    for start in range(0, nx, step):
+        xc = x[start:start+step]
+        zc = z[:,start:start+step]
+        n = xc.shape[0]
+
+        if method == 'complex':
+            # No unperturbed copy needed
+            zs = np.repeat(zc[:,None,:].astype(complex), ngroups, axis=1)
+            zs[np.arange(nz),colors,:] += 1j * _COMPLEX_STEP
+            f1 = np.asarray(f(np.tile(xc, ngroups),
+                              np.reshape(zs, [nz, ngroups * n])))
+            f1 = np.reshape(f1, [-1, ngroups, n])
+            dfc = f1[:,colors,:].imag / _COMPLEX_STEP
+        else:
+            # Unperturbed copy first, unless given
+            nbase = 1 if f0 is None else 0
+            ncopies = ngroups + nbase
+            zs = np.repeat(zc[:,None,:], ncopies, axis=1)
+            zs[np.arange(nz),colors + nbase,:] += eps
+            f1 = np.asarray(f(np.tile(xc, ncopies),
+                              np.reshape(zs, [nz, ncopies * n])))
+            f1 = np.reshape(f1, [-1, ncopies, n])
+            if f0 is None:
+                fbase = f1[:,:1,:]
+            else:
+                fbase = np.asarray(f0)[:,None,start:start+step]
+            dfc = (f1[:,colors+nbase,:] - fbase) / eps
+
+        if df is None:
+            df = np.empty([dfc.shape[0], nz, nx], dtype=dfc.dtype)
+        df[:,:,start:start+step] = dfc
+    if df is None:
+        df = np.empty([0, nz, 0], dtype=z.dtype)
+    elif sparsity is not None:
+        df *= sparsity[:,:,None]
+    return df
+
 def check_jacobian(N, f, df, bounds=None,
                    eps=1e-6, rtol=1e-3, atol=1e-8, times=None):
     """Check that ``df`` is a partial derivative of ``f``.
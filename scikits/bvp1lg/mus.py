@@ -28,6 +28,22 @@ boundary-value problems.
     I have not yet figured out what the problem is, so you may be
     better off using the `colnew` package.
 
+Compiled functions
+------------------
+
+The right-hand sides and the boundary conditions can also be compiled
+functions, given as `ctypes` or `cffi` function pointers, PyCapsules,
+or `scipy.LowLevelCallable` objects. MUS then calls them directly,
+without going through Python. They take the Fortran argument lists, as
+the C functions::
+
+    void f(int *n, double *t, double *u, double *f);
+    void gsub(int *n, double *u_a, double *u_b,
+              double *g, double *dga, double *dgb);
+
+where the Jacobians are in Fortran order,
+``dga[i + n*j] = d g_i / d u_a[j]``.
+
 References
 ----------
 
@@ -41,6 +57,7 @@ from __future__ import absolute_import, division, print_function
 
 import numpy as np
 from . import _mus
+from . import _lowlevel
 import warnings as _warnings
 
 from .error import *
@@ -158,9 +175,34 @@ def __get_tolerance(rtol, atol):
 
 ###############################################################################
 
+def __filling(func):
+    """Make ``func(*args)`` write its result to the extra argument ``out``,
+    as the callbacks of `_mus` do."""
+    def wrapper(*args):
+        out = args[-1]
+        out[...] = np.reshape(np.asarray(func(*args[:-1])), out.shape)
+    return wrapper
+
+def __filling_gsub(gsub):
+    """Make ``gsub(ya, yb)`` fill in ``fg``, ``dga`` and ``dgb``."""
+    def wrapper(ya, yb, fg, dga, dgb):
+        for out, value in zip((fg, dga, dgb), gsub(ya, yb)):
+            out[...] = np.reshape(np.asarray(value), out.shape)
+    return wrapper
+
+def __callback(func, inplace, filling):
+    """Callback for `_mus`: compiled and in-place functions as they are,
+    other functions wrapped with `filling`."""
+    native = _lowlevel.capsule(func)
+    if native is not None:
+        return native
+    elif inplace:
+        return func
+    return filling(func)
+
 def solve_linear(f_homogenous, f_nonhomogenous, a, b, m_a, m_b, bcv,
                  max_amplification=None, rtol=None, atol=None,
-                 output_points=None, verbosity=0):
+                 output_points=None, verbosity=0, inplace=False):
     """Solve a linear two-point boundary value problem.
 
     The problem is assumed to be::
@@ -217,6 +259,15 @@ def solve_linear(f_homogenous, f_nonhomogenous, a, b, m_a, m_b, bcv,
       - `verbosity`:
         0 silent, 1 some output, 2 more output
 
+      - `inplace`:
+        If True, `f_homogenous` and `f_nonhomogenous` are given as
+        ``f(t, u, out)``, writing the result to the (n,) array ``out``.
+        ``out`` is a view of the array in MUS, so the result is written
+        into it directly rather than returned and copied.
+
+        The functions can also be compiled functions; see
+        `Compiled functions` in the module docstring.
+
     :returns:
         A tuple ``(t, y)`` where ``t`` is a (m,) array of mesh points, and
         ``y`` is (m, n) array of solution values at the mesh points.
@@ -251,6 +302,9 @@ def solve_linear(f_homogenous, f_nonhomogenous, a, b, m_a, m_b, bcv,
     if ierror < -1: ierror = -1
     if ierror >  1: ierror =  1
 
+    f_homogenous = __callback(f_homogenous, inplace, __filling)
+    f_nonhomogenous = __callback(f_nonhomogenous, inplace, __filling)
+
     er, nrti, ti, y, ierror = _mus.musl(f_homogenous, f_nonhomogenous,
                                         ihom, a, b, m_a, m_b, bcv,
                                         er, nrti, ti, ierror,
@@ -268,7 +322,7 @@ def solve_linear(f_homogenous, f_nonhomogenous, a, b, m_a, m_b, bcv,
 def solve_nonlinear(func, gsub, initial_guess, a, b,
                     max_amplification=0, rtol=1e-5, atol=None,
                     output_points=None, verbosity=0,
-                    iteration_limit=100):
+                    iteration_limit=100, inplace=False):
     """Solve a non-linear two-point boundary value problem.
 
     The problem is assumed to be::
@@ -328,6 +382,16 @@ def solve_nonlinear(func, gsub, initial_guess, a, b,
       
       - `iteration_limit`:
         Maximum allowed number of Newton iterations
+
+      - `inplace`:
+        If True, `func` and `gsub` are given as ``func(t, u, out)`` and
+        ``gsub(u_a, u_b, g, dga, dgb)``, writing their results to the
+        output arrays. These are views of the arrays in MUS, so the
+        results are written into them directly rather than returned and
+        copied.
+
+        `func` and `gsub` can also be compiled functions; see
+        `Compiled functions` in the module docstring.
       
     :returns:
         A tuple ``(t, u)`` where ``t`` is a (m,) array of mesh points, and
@@ -348,8 +412,11 @@ def solve_nonlinear(func, gsub, initial_guess, a, b,
 
     ## Determine size
 
-    f0 = func(a, initial_guess(a))
-    n = len(f0)
+    if inplace or _lowlevel.capsule(func) is not None:
+        n = len(initial_guess(a))
+    else:
+        f0 = func(a, initial_guess(a))
+        n = len(f0)
 
     ## Output points
 
@@ -383,6 +450,10 @@ def solve_nonlinear(func, gsub, initial_guess, a, b,
     if ierror < -1: ierror = -1
     if ierror >  1: ierror =  1
 
+    func = __callback(func, inplace, __filling)
+    gsub = __callback(gsub, inplace, __filling_gsub)
+    initial_guess = __filling(initial_guess)
+
     er, ti, nrti, y, ierror = _mus.musn(func, initial_guess, gsub,
                                         n, a, b,
                                         er, ti, nrti, iteration_limit, lwg,
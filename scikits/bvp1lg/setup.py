@@ -1,6 +1,7 @@
 #!/usr/bin/env python
 from __future__ import absolute_import, division, print_function
 
+import os
 import warnings
 from numpy.distutils.misc_util import Configuration
 from numpy.distutils.system_info import (get_info, AtlasNotFoundError,
@@ -8,20 +9,39 @@ from numpy.distutils.system_info import (get_info, AtlasNotFoundError,
 
 def configuration(parent_package='', top_path=None):
     blas_info = get_info('lapack_opt')
+    colfac_macros = []
     if not blas_info:
         blas_info = get_info('blas')
         if not blas_info:
             # Blas is required
             print("\nError:\n%s\n" % BlasNotFoundError.__doc__)
             raise SystemExit(1)
+        # COLNEW's blocks are then factored with LINPACK only
+        colfac_macros = [('NO_LAPACK', None)]
+
+    colnew_info = dict(blas_info)
+    colnew_info['define_macros'] = (list(blas_info.get('define_macros', []))
+                                    + colfac_macros)
+
+    # COLNEW builds the collocation blocks of the subintervals, and the
+    # partitioned solver eliminates its groups of them, in parallel when
+    # compiled with OpenMP, enabled by giving the compiler flags for it,
+    # as in BVP1LG_OPENMP=-fopenmp
+    openmp_flags = os.environ.get('BVP1LG_OPENMP', '').split()
+    if openmp_flags:
+        colnew_info['extra_f77_compile_args'] = openmp_flags
+        colnew_info['extra_link_args'] = (
+            list(blas_info.get('extra_link_args', [])) + openmp_flags)
 
     config = Configuration('bvp1lg', parent_package, top_path)
     config.add_extension('_colnew',
                          sources=['../../lib/colnew.pyf',
                                   '../../lib/colnew.f',
-                                  '../../lib/dgesl.f',
+                                  '../../lib/colfac.F',
+                                  '../../lib/colpab.f'],
+                         depends=['../../lib/dgesl.f',
                                   '../../lib/dgefa.f'],
-                         **blas_info)
+                         **colnew_info)
     config.add_extension('_mus',
                          sources=['../../lib/mus.pyf',
                                   '../../lib/mus1.f',
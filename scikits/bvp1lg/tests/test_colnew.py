@@ -7,9 +7,15 @@ from __future__ import division, absolute_import, print_function
 
 from numpy.testing import *
 import numpy as np
+import ctypes
 import inspect
+import os
+import pickle
+import shutil
+import tempfile
 
 import scikits.bvp1lg.colnew as colnew
+from scikits.bvp1lg import TooManySubintervals
 
 from testutils import *
 from test_problems import *
@@ -73,6 +79,17 @@ def solve_with_colnew(problem, numerical_jacobians=False,
                                 **kw)
     return solution
 
+def problem3_factory(C):
+    # Problem #3 for solve_many; must be picklable
+    problem = Problem3()
+    problem.C = C
+    return dict(boundary_points=[problem.a, problem.b],
+                degrees=problem.m,
+                fsub=problem.f,
+                gsub=lambda z: problem.g(z[:,0], z[:,1]),
+                initial_guess=problem.guess,
+                tolerances=[1e-5, 1e-5])
+
 ###############################################################################
 
 class TestColnew(object):
@@ -318,6 +335,429 @@ class TestColnew(object):
                       solve_with_colnew, problem, tolerances=[1, 2, 3],
                       numerical_jacobians=num_jac)
 
+    def test_mesh_size_growth(self, num_jac=False):
+        # Solve problem #3 starting from a too small workspace
+        problem = Problem3()
+        x = np.linspace(0, 1, 20)
+        tol = [1e-8, 1e-8]
+
+        assert_raises(TooManySubintervals,
+                      solve_with_colnew, problem, tolerances=tol,
+                      maximum_mesh_size=12, numerical_jacobians=num_jac)
+
+        solution = solve_with_colnew(problem, tolerances=tol,
+                                     maximum_mesh_size=12,
+                                     mesh_size_growth=2,
+                                     numerical_jacobians=num_jac)
+        assert solution.nmesh > 12
+        assert np.allclose(problem.exact_solution(x), solution(x)[:,0],
+                           rtol=1e-7)
+
+        # Same, with fixed mesh refinement
+        solution = solve_with_colnew(problem, tolerances=tol,
+                                     initial_mesh=np.linspace(0, 1, 5),
+                                     adaptive_mesh_selection=False,
+                                     maximum_mesh_size=12,
+                                     mesh_size_growth=2,
+                                     numerical_jacobians=num_jac)
+        mesh_delta = np.diff(solution.mesh)
+        assert np.allclose(mesh_delta, mesh_delta[0], rtol=1e-9, atol=1e-9)
+        assert np.allclose(problem.exact_solution(x), solution(x)[:,0],
+                           rtol=1e-7)
+
+        # The workspace limit is respected
+        assert_raises(TooManySubintervals,
+                      solve_with_colnew, problem, tolerances=tol,
+                      maximum_mesh_size=12, mesh_size_growth=2,
+                      maximum_workspace_size=8192,
+                      numerical_jacobians=num_jac)
+
+        assert_raises(ValueError,
+                      solve_with_colnew, problem, mesh_size_growth=1,
+                      numerical_jacobians=num_jac)
+
+    def test_jac_sparsity(self):
+        # Numerical partial derivatives with a given sparsity pattern
+        problem = Problem9()
+        x = np.linspace(problem.a, problem.b, 10)
+        z = np.random.rand(sum(problem.m), len(x))
+        sparsity = np.any(problem.df(x, z) != 0, axis=2)
+        assert not np.all(sparsity)
+
+        solution = solve_with_colnew(problem, numerical_jacobians=True,
+                                     jac_sparsity=sparsity)
+        assert np.allclose(problem.exact_solution(x), solution(x),
+                           rtol=1e-3, atol=1e-6)
+
+        assert_raises(ValueError, solve_with_colnew, problem,
+                      numerical_jacobians=True, jac_sparsity=sparsity[1:])
+
+    def test_jacobian_method(self):
+        # Complex-step partial derivatives
+        problem = Problem3()
+        solution = solve_with_colnew(problem, numerical_jacobians=True,
+                                     jacobian_method='complex')
+        x = np.linspace(problem.a, problem.b, 100)
+        assert np.allclose(problem.exact_solution(x), solution(x)[:,0],
+                          rtol=1e-5)
+
+        assert_raises(ValueError, solve_with_colnew, problem,
+                      jacobian_method='central')
+        assert_raises(ValueError, solve_with_colnew, ComplexProblem2(),
+                      is_complex=True, jacobian_method='complex')
+
+    def test_fdfsub(self):
+        # Fused fsub and dfsub are evaluated once per point set
+        problem = Problem3()
+        calls = []
+        def fdfsub(x, z):
+            calls.append(len(x))
+            return problem.f(x, z), problem.df(x, z)
+        def gsub(z):
+            return problem.g(z[:,0], z[:,1])
+        kw = dict(initial_guess=problem.guess, tolerances=[1e-5, 1e-5])
+
+        solution = colnew.solve([problem.a, problem.b], problem.m,
+                                None, gsub, fdfsub=fdfsub, **kw)
+        x = np.linspace(problem.a, problem.b, 100)
+        assert np.allclose(problem.exact_solution(x), solution(x)[:,0],
+                          rtol=1e-5)
+
+        # Same result as with separate functions, with fewer calls
+        counts = {'f': 0, 'df': 0}
+        def fsub(x, z):
+            counts['f'] += 1
+            return problem.f(x, z)
+        def dfsub(x, z):
+            counts['df'] += 1
+            return problem.df(x, z)
+        solution2 = colnew.solve([problem.a, problem.b], problem.m,
+                                 fsub, gsub, dfsub=dfsub, **kw)
+        assert np.allclose(solution(x), solution2(x), rtol=1e-12, atol=0)
+        assert len(calls) < counts['f'] + counts['df']
+
+        assert_raises(ValueError, colnew.solve, [problem.a, problem.b],
+                      problem.m, None, gsub, **kw)
+
+    def test_inplace(self):
+        # Functions writing to views of the COLNEW arrays
+        problem = Problem3()
+        def fsub(x, z, f):
+            f[...] = problem.f(x, z)
+        def dfsub(x, z, df):
+            df[...] = problem.df(x, z)
+        def gsub(z, g):
+            g[...] = problem.g(z[:,0], z[:,1])
+        kw = dict(initial_guess=problem.guess, tolerances=[1e-5, 1e-5],
+                  inplace=True)
+
+        x = np.linspace(problem.a, problem.b, 100)
+        for dfsub_ in [dfsub, None]:
+            solution = colnew.solve([problem.a, problem.b], problem.m,
+                                    fsub, gsub, dfsub=dfsub_, **kw)
+            assert np.allclose(problem.exact_solution(x), solution(x)[:,0],
+                               rtol=1e-5)
+
+        assert_raises(ValueError, colnew.solve, [problem.a, problem.b],
+                      problem.m, fsub, gsub, vectorized=False, **kw)
+
+    def test_compiled_callbacks(self):
+        # ctypes function pointers are called by COLNEW directly
+        problem = Problem3()
+        c_int_p = ctypes.POINTER(ctypes.c_int)
+        c_double_p = ctypes.POINTER(ctypes.c_double)
+        f_type = ctypes.CFUNCTYPE(None, c_int_p, c_int_p, c_int_p,
+                                  c_double_p, c_double_p, c_double_p)
+        g_type = ctypes.CFUNCTYPE(None, c_int_p, c_int_p,
+                                  c_double_p, c_double_p)
+
+        def array(p, *shape):
+            # Fortran-ordered view of a C array
+            return np.ctypeslib.as_array(p, shape=shape[::-1]).T
+
+        @f_type
+        def fsub(ncomp, mstar, nx, x, z, f):
+            n = nx[0]
+            array(f, ncomp[0], n)[...] = problem.f(array(x, n),
+                                                   array(z, mstar[0], n))
+        @f_type
+        def dfsub(ncomp, mstar, nx, x, z, df):
+            n = nx[0]
+            array(df, ncomp[0], mstar[0], n)[...] = problem.df(
+                array(x, n), array(z, mstar[0], n))
+        @g_type
+        def gsub(ncomp, mstar, z, g):
+            z = array(z, mstar[0], mstar[0])
+            array(g, mstar[0])[...] = problem.g(z[:,0], z[:,1])
+        @g_type
+        def dgsub(ncomp, mstar, z, dg):
+            z = array(z, mstar[0], mstar[0])
+            dga, dgb = problem.dg(z[:,0], z[:,1])
+            array(dg, mstar[0], mstar[0]).T[...] = np.r_[dga[:1], dgb[1:]]
+        @f_type
+        def guess(ncomp, mstar, nx, x, z, dm):
+            n = nx[0]
+            array(z, mstar[0], n)[...], array(dm, ncomp[0], n)[...] = \
+                problem.guess(array(x, n))
+
+        x = np.linspace(problem.a, problem.b, 100)
+        kw = dict(tolerances=[1e-5, 1e-5])
+        for initial_guess in [guess, problem.guess]:
+            solution = colnew.solve([problem.a, problem.b], problem.m,
+                                    fsub, gsub, dfsub=dfsub, dgsub=dgsub,
+                                    initial_guess=initial_guess, **kw)
+            assert np.allclose(problem.exact_solution(x), solution(x)[:,0],
+                               rtol=1e-5)
+
+        # Compiled and Python functions mix
+        solution = colnew.solve([problem.a, problem.b], problem.m,
+                                problem.f, gsub, dfsub=problem.df,
+                                dgsub=dgsub, initial_guess=problem.guess,
+                                **kw)
+        assert np.allclose(problem.exact_solution(x), solution(x)[:,0],
+                           rtol=1e-5)
+
+        assert_raises(ValueError, colnew.solve, [problem.a, problem.b],
+                      problem.m, fsub, gsub, dgsub=dgsub,
+                      initial_guess=problem.guess, **kw)
+
+    def test_stats(self):
+        # Calls to the user routines, and the progress of COLNEW
+        problem = Problem3()
+        solution = solve_with_colnew(problem)
+        stats = solution.stats
+        for name in ['fsub', 'dfsub', 'gsub', 'dgsub', 'guess']:
+            assert stats.calls[name] > 0
+            assert stats.points[name] >= stats.calls[name]
+            assert stats.callback_time[name] >= 0
+        assert stats.points['gsub'] == 2 * stats.calls['gsub']
+        assert stats.fortran_time >= 0
+        assert stats.meshes[-1] == solution.nmesh - 1
+        assert len(stats.iterations) == len(stats.meshes)
+        assert max(stats.iterations) > 0
+        assert stats.error_estimates.shape == (2,)
+
+        assert pickle.loads(pickle.dumps(solution)).stats is None
+
+    def test_hooks(self):
+        # Progress records, and early termination
+        problem = Problem3()
+        iterations = []
+        meshes = []
+        solution = solve_with_colnew(problem, on_iteration=iterations.append,
+                                     on_mesh=meshes.append)
+        stats = solution.stats
+        assert not stats.terminated
+        assert [info.mesh_number for info in meshes] == \
+               list(range(len(stats.meshes)))
+        assert [len(info.mesh) - 1 for info in meshes] == stats.meshes
+        assert np.all(meshes[-1].mesh == solution.mesh)
+        assert np.all(meshes[0].error_estimates == 0)
+        assert len(iterations) > 0
+        for info in iterations:
+            assert 0 < info.iteration <= stats.iterations[info.mesh_number]
+            assert info.residual_norm >= 0
+            assert len(info.mesh) - 1 == stats.meshes[info.mesh_number]
+
+        solution = solve_with_colnew(problem, on_mesh=lambda info: True)
+        assert solution.stats.terminated
+        assert sum(solution.stats.iterations) < sum(stats.iterations)
+
+    def test_prepared_problem(self):
+        # A prepared problem solved repeatedly with different parameters
+        problem = Problem3()
+        def gsub(z, C):
+            problem.C = C
+            return problem.g(z[:,0], z[:,1])
+        def dgsub(z, C):
+            x = problem.dg(z[:,0], z[:,1])
+            return np.r_[x[0][:1,:], x[1][1:,:]]
+
+        prepared = colnew.prepare([problem.a, problem.b], problem.m,
+                                  lambda x, z, C: problem.f(x, z), gsub,
+                                  dfsub=lambda x, z, C: problem.df(x, z),
+                                  dgsub=dgsub, tolerances=[1e-5, 1e-5])
+        assert isinstance(prepared, colnew.Problem)
+
+        workspaces = []
+        solutions = []
+        for C in [1.5, 2.0, 1.5]:
+            solution = prepared.solve(initial_guess=problem.guess, params=C)
+            workspaces.append([id(a) for a in prepared._workspace])
+            solutions.append(solution)
+            problem.C = C
+            assert np.all(solution.fspace ==
+                          solve_with_colnew(problem).fspace)
+        assert not np.allclose(solutions[0](0.5),
+                               solutions[1](0.5))
+
+        # The problem keeps its workspace between solves
+        assert workspaces[0] == workspaces[1] == workspaces[2]
+
+    def test_prepared_problem_nested(self):
+        # u'' + u = a, u(0) = u(1) = 0, solved again with another a
+        # from within its own fsub
+        nested = []
+        def fsub(x, z, a):
+            if not nested:
+                nested.append(None)
+                nested.append(problem.solve(params=2.0))
+            return np.array([a - z[0]])
+        def dfsub(x, z, a):
+            return np.array([[-np.ones_like(x), np.zeros_like(x)]])
+        def gsub(z, a):
+            return np.array([z[0,0], z[0,1]])
+        def exact(x, a):
+            return a*(1 - np.cos(x) - (1 - np.cos(1))*np.sin(x)/np.sin(1))
+
+        problem = colnew.prepare([0.0, 1.0], [2], fsub, gsub, dfsub=dfsub,
+                                 is_linear=True, tolerances=[1e-8, 1e-8])
+        solution = problem.solve(params=1.0)
+        x = np.linspace(0, 1, 50)
+        assert np.allclose(solution(x)[:,0], exact(x, 1.0), atol=1e-7)
+        assert np.allclose(nested[1](x)[:,0], exact(x, 2.0), atol=1e-7)
+        assert problem._params[0] is None
+
+    def test_factorization(self):
+        # u'' + u = a, u(0) = b, u(1) = c, for several (a, b, c)
+        def fsub(x, z, p):
+            return np.array([p[0] - z[0]])
+        def dfsub(x, z, p):
+            return np.array([[-np.ones_like(x), np.zeros_like(x)]])
+        def gsub(z, p):
+            return np.array([z[0,0] - p[1], z[0,1] - p[2]])
+        def dgsub(z, p):
+            return np.array([[1.0, 0.0], [1.0, 0.0]])
+        def exact(x, p):
+            a, b, c = p
+            return a + (b - a)*np.cos(x) + ((c - a) - (b - a)*np.cos(1)) \
+                   * np.sin(x) / np.sin(1)
+
+        problem = colnew.prepare([0.0, 1.0], [2], fsub, gsub,
+                                 dfsub=dfsub, dgsub=dgsub, is_linear=True,
+                                 tolerances=[1e-8, 1e-8])
+        factorization = problem.factor(params=(1.0, 0.0, 0.0))
+
+        x = np.linspace(0, 1, 50)
+        params = [(1.0, 0.0, 0.0), (0.0, 1.0, 0.0), (0.0, 0.0, 1.0),
+                  (2.0, -1.0, 3.0)]
+        solutions = factorization.solve_many(params)
+        for p, solution in zip(params, solutions):
+            assert np.all(solution.mesh == factorization.mesh)
+            assert np.allclose(solution(x)[:,0], exact(x, p), atol=1e-7)
+            # no Jacobians are needed for the substitution
+            assert solution.stats.calls['dfsub'] == 0
+            assert solution.stats.calls['dgsub'] == 0
+        assert np.allclose(solutions[0](x), factorization.solution(x),
+                           rtol=1e-10, atol=1e-12)
+
+        # Solutions are linear in the right-hand side
+        assert np.allclose(solutions[3](x),
+                           2*solutions[0](x) - solutions[1](x)
+                           + 3*solutions[2](x), rtol=1e-10, atol=1e-12)
+        assert np.allclose(factorization.solve((2.0, -1.0, 3.0))(x),
+                           solutions[3](x), rtol=1e-10, atol=1e-12)
+
+        # Only linear problems can be factored
+        nonlinear = colnew.prepare([0.0, 1.0], [2], fsub, gsub,
+                                   dfsub=dfsub, dgsub=dgsub)
+        assert_raises(ValueError, nonlinear.factor, (1.0, 0.0, 0.0))
+
+    def test_workspace_pool(self):
+        # Consecutive solves reuse the same workspace arrays
+        problem = Problem3()
+        pool = colnew._workspace_pool
+        old_size = colnew.set_workspace_pool_size(2**25)
+        try:
+            solution1 = solve_with_colnew(problem)
+            arrays = [id(a) for entries in pool.entries.values()
+                      for pair in entries for a in pair]
+            nbytes = pool.nbytes
+
+            solution2 = solve_with_colnew(problem)
+            assert pool.nbytes == nbytes
+            assert [id(a) for entries in pool.entries.values()
+                    for pair in entries for a in pair] == arrays
+
+            # Solutions don't share data with the workspace
+            assert np.all(solution1.fspace == solution2.fspace)
+
+            colnew.set_workspace_pool_size(0)
+            assert pool.nbytes == 0 and not pool.entries
+        finally:
+            colnew.set_workspace_pool_size(old_size)
+
+    def test_lapack_threshold(self):
+        # LINPACK and LAPACK factorizations give the same solution
+        problem = Problem2()
+        old_order = colnew.set_lapack_threshold(None)
+        try:
+            assert colnew.set_lapack_threshold(0) is None
+            solution1 = solve_with_colnew(problem)
+            assert colnew.set_lapack_threshold(None) == 0
+            solution2 = solve_with_colnew(problem)
+        finally:
+            colnew.set_lapack_threshold(old_order)
+        assert colnew.set_lapack_threshold(old_order) == old_order
+
+        assert np.all(solution1.mesh == solution2.mesh)
+        x = np.linspace(problem.a, problem.b, 100)
+        assert np.allclose(solution1(x), solution2(x), rtol=1e-10, atol=0)
+
+    def test_assembly_threads(self):
+        # The blocks are built the same way in any number of threads
+        problem = Problem2()
+        solution1 = solve_with_colnew(problem, threads=1)
+        solution2 = solve_with_colnew(problem, threads=4)
+
+        assert np.all(solution1.mesh == solution2.mesh)
+        x = np.linspace(problem.a, problem.b, 100)
+        assert np.allclose(solution1(x), solution2(x), rtol=1e-10, atol=0)
+
+        assert_raises(ValueError, solve_with_colnew, problem, threads=0)
+
+    def test_partitioned_abd_solver(self):
+        # The partitioned solver gives the solution of FCBLOK/SBBLOK, for
+        # any number of groups, also more than there are subintervals
+        for problem in [Problem1(), Problem3(), Problem6()]:
+            solution1 = solve_with_colnew(problem)
+            x = np.linspace(problem.a, problem.b, 100)
+            for threads in [1, 3, 64]:
+                solution2 = solve_with_colnew(problem, threads=threads,
+                                              abd_solver='partitioned')
+                assert np.all(solution1.mesh == solution2.mesh)
+                assert np.allclose(solution2(x), solution1(x),
+                                   rtol=1e-8, atol=1e-10)
+
+        # Side conditions inside the interval: u''' = 0 through
+        # (0, 1), (0.5, 0) and (1, 2)
+        def fsub(x, z):
+            return np.zeros([1, len(x)])
+        def dfsub(x, z):
+            return np.zeros([1, 3, len(x)])
+        def gsub(z):
+            return np.array([z[0,0] - 1, z[0,1], z[0,2] - 2])
+        def dgsub(z):
+            return np.array([[1.0, 0.0, 0.0]]*3)
+
+        x = np.linspace(0, 1, 50)
+        for abd_solver in ['sequential', 'partitioned']:
+            problem = colnew.prepare([0.0, 0.5, 1.0], [3], fsub, gsub,
+                                     dfsub=dfsub, dgsub=dgsub,
+                                     is_linear=True, threads=3,
+                                     abd_solver=abd_solver)
+            solution = problem.solve()
+            assert np.allclose(solution(x)[:,0], 1 - 5*x + 6*x**2,
+                               atol=1e-10)
+
+            # the factors are kept for other right-hand sides
+            factorization = problem.factor()
+            assert np.allclose(factorization.solve(None)(x), solution(x),
+                               rtol=1e-10, atol=1e-12)
+
+        assert_raises(ValueError, solve_with_colnew, Problem1(),
+                      abd_solver='parallel')
+
     def test_problem_jacobians(self):
         solve_with_colnew(Problem1(), check_jacobian_only=True)
         solve_with_colnew(Problem2(), check_jacobian_only=True)
@@ -354,6 +794,251 @@ class TestColnew(object):
         assert np.allclose(problem1.exact_solution(x), solution(x)[:,0],
                           rtol=1e-5)
 
+    def test_threads(self):
+        # Solve problems concurrently from several threads, with nested
+        # solves inside the user routines
+        import threading
+
+        class NestedProblem(Problem3):
+            nested = False
+            def f(self, x, z):
+                if not self.nested:
+                    self.nested = True
+                    problem = Problem1()
+                    solution = solve_with_colnew(problem)
+                    xx = np.linspace(problem.a, problem.b, 100)
+                    ok.append(np.allclose(problem.exact_solution(xx),
+                                          solution(xx)[:,0], rtol=1e-5))
+                return Problem3.f(self, x, z)
+
+        ok = []
+        def worker():
+            problem = NestedProblem()
+            solution = solve_with_colnew(problem)
+            x = np.linspace(problem.a, problem.b, 100)
+            ok.append(np.allclose(problem.exact_solution(x),
+                                  solution(x)[:,0], rtol=1e-5))
+
+        threads = [threading.Thread(target=worker) for j in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        assert len(ok) == 16 and all(ok)
+
+    def test_concurrent_solves(self):
+        # Solves in different threads run at the same time: the fsub of
+        # each waits until the other thread is inside COLNEW too
+        import threading
+        barrier = threading.Barrier(2, timeout=60)
+
+        class WaitingProblem(Problem1):
+            waited = False
+            def f(self, x, z):
+                if not self.waited:
+                    self.waited = True
+                    barrier.wait()
+                return Problem1.f(self, x, z)
+
+        ok = []
+        def worker():
+            problem = WaitingProblem()
+            solution = solve_with_colnew(problem)
+            x = np.linspace(problem.a, problem.b, 100)
+            ok.append(np.allclose(problem.exact_solution(x),
+                                  solution(x)[:,0], rtol=1e-5))
+
+        threads = [threading.Thread(target=worker) for j in range(2)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        assert len(ok) == 2 and all(ok)
+
+    def test_solve_many(self):
+        # Solve problem #3 for many values of C in worker processes
+        Cvals = [1.0, 1.2, 1.4, 1.6]
+        x = np.linspace(0, 1, 100)
+
+        for workers in [1, 2]:
+            results = colnew.solve_many(problem3_factory, Cvals,
+                                        workers=workers)
+            assert len(results) == len(Cvals)
+            for C, solution in zip(Cvals, results):
+                problem = Problem3()
+                problem.C = C
+                assert isinstance(solution, colnew.Solution)
+                assert np.allclose(problem.exact_solution(x),
+                                   solution(x)[:,0], rtol=1e-5)
+
+        # Failures are captured per item
+        results = colnew.solve_many(problem3_factory, [1.0, 1.2],
+                                    workers=2, collocation_points=8)
+        assert all(isinstance(r, ValueError) for r in results)
+
+    def test_threaded_evaluation(self):
+        # Evaluate a solution concurrently from several threads
+        import threading
+
+        problem = Problem3()
+        solution = solve_with_colnew(problem)
+        x = np.linspace(problem.a, problem.b, 10001)
+        expected = solution(x)
+
+        ok = []
+        def worker():
+            for j in range(5):
+                ok.append(np.array_equal(solution(x), expected))
+
+        threads = [threading.Thread(target=worker) for j in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        assert len(ok) == 20 and all(ok)
+
+    def test_to_ppoly(self):
+        # Piecewise polynomial form of the solution
+        problem = Problem7()
+        solution = solve_with_colnew(problem, maximum_mesh_size=500,
+                                     initial_guess=None,
+                                     collocation_points=4,
+                                     tolerances=[1e-4]*4)
+        ppoly = solution.to_ppoly()
+        x = np.linspace(problem.a, problem.b, 1001)
+        assert np.allclose(ppoly(x), solution(x), rtol=1e-10, atol=1e-10)
+        assert ppoly(x[:,None]).shape == solution(x[:,None]).shape
+
+        # u' == d/dx u (problem #7 has degrees [2, 2])
+        assert np.allclose(ppoly.derivative()(x)[:,0], solution(x)[:,1],
+                           rtol=1e-10, atol=1e-10)
+
+        # Coefficients are cached
+        assert solution._get_coefficients() is solution._get_coefficients()
+
+        problem = ComplexProblem2()
+        solution = solve_with_colnew(problem, is_complex=True)
+        x = np.linspace(problem.a, problem.b, 1001)
+        assert np.allclose(solution.to_ppoly()(x), solution(x),
+                           rtol=1e-10, atol=1e-10)
+
+    def test_selective_evaluation(self):
+        # Evaluating selected components in chunks to a given buffer
+        problem = Problem7()
+        solution = solve_with_colnew(problem, maximum_mesh_size=500,
+                                     initial_guess=None,
+                                     collocation_points=4,
+                                     tolerances=[1e-4]*4)
+        x = np.linspace(problem.a, problem.b, 1001).reshape(7, 143)
+        y = solution(x)
+
+        out = np.empty(x.shape + (2,))
+        z = solution(x, components=[3, 0], out=out, chunk_size=100)
+        assert z is out
+        assert np.allclose(z, y[...,[3, 0]], rtol=1e-10, atol=1e-10)
+
+        z = solution(x, chunk_size=100)
+        assert np.allclose(z, y, rtol=1e-13, atol=1e-13)
+
+        assert_raises(ValueError, solution, x, components=[0],
+                      out=np.empty(x.shape + (1,)).T)
+
+        problem = ComplexProblem2()
+        solution = solve_with_colnew(problem, is_complex=True)
+        x = np.linspace(problem.a, problem.b, 101)
+        assert np.allclose(solution(x, components=[1]), solution(x)[:,[1]],
+                           rtol=1e-10, atol=1e-10)
+
+    def test_threaded_unsorted_evaluation(self):
+        # Evaluation at points in random order on several threads
+        problem = Problem3()
+        solution = solve_with_colnew(problem)
+        x = np.linspace(problem.a, problem.b, 2001)
+        y = solution(x)
+        perm = np.random.RandomState(1234).permutation(len(x))
+
+        for components in [None, [1, 0]]:
+            z = solution(x[perm], components=components, chunk_size=100,
+                         threads=4)
+            if components is not None:
+                z = z[:,::-1]
+            assert np.allclose(z, y[perm], rtol=1e-10, atol=1e-10)
+
+        # Points outside the mesh are moved to its ends
+        x = [problem.a - 1, problem.b + 1]
+        assert np.allclose(solution(x, components=[0, 1]), solution(x),
+                           rtol=1e-10, atol=1e-10)
+
+    def test_save_load(self):
+        # Solutions survive pickling and binary archives
+        problem = Problem3()
+        solutions = []
+        for C in [1.0, 1.5]:
+            problem.C = C
+            solutions.append(solve_with_colnew(problem))
+        solutions.append(solve_with_colnew(ComplexProblem2(),
+                                           is_complex=True))
+        x = np.linspace(0, 1, 11)
+
+        solution = pickle.loads(pickle.dumps(solutions[0]))
+        assert np.all(solution(x) == solutions[0](x))
+
+        tmpdir = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(tmpdir, 'solutions.bin')
+            colnew.save_solutions(filename, solutions)
+            for mmap in [True, False]:
+                loaded = colnew.load_solutions(filename, mmap=mmap)
+                assert len(loaded) == len(solutions)
+                for a, b in zip(loaded, solutions):
+                    assert np.all(a(x) == b(x))
+
+            solution = colnew.Solution.load(filename, index=1)
+            assert isinstance(solution.fspace, np.memmap)
+            assert np.all(solution(x) == solutions[1](x))
+
+            solutions[2].save(filename)
+            solution = colnew.Solution.load(filename)
+            assert np.all(solution(x) == solutions[2](x))
+
+            with open(filename, 'r+b') as f:
+                f.write(b'X')
+            assert_raises(ValueError, colnew.load_solutions, filename)
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_evaluation_operator(self):
+        # Sampling solutions on a common mesh with a sparse operator
+        problem = Problem3()
+        mesh = np.linspace(problem.a, problem.b, 21)
+        solutions = []
+        for C in [1.0, 1.5]:
+            problem.C = C
+            solutions.append(solve_with_colnew(problem, initial_mesh=mesh,
+                                               adaptive_mesh_selection=False))
+        x = np.linspace(problem.a, problem.b, 37).reshape(37, 1)
+
+        op = solutions[0].evaluation_operator(x)
+        assert solutions[1].evaluation_operator(x) is op
+        for solution in solutions:
+            y = (op * solution.fspace).reshape(x.shape + (solution.mstar,))
+            assert np.allclose(y, solution(x), rtol=1e-10, atol=1e-10)
+
+        # Higher order collocation (k = 4, problem #7 has degrees [2, 2])
+        problem = Problem7()
+        solution = solve_with_colnew(problem, maximum_mesh_size=500,
+                                     initial_guess=None,
+                                     collocation_points=4,
+                                     tolerances=[1e-4]*4)
+        x = np.linspace(problem.a, problem.b, 101)
+        op = solution.evaluation_operator(x)
+        y = (op * solution.fspace).reshape(x.shape + (solution.mstar,))
+        z = colnew._colnew.appsln_many(x, solution.fspace, solution.ispace).T
+        assert np.allclose(y, z, rtol=1e-10, atol=1e-10)
+
 ###############################################################################
 
 class TestColnewNumericalJacobians(TestColnew):
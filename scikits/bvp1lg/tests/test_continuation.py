@@ -0,0 +1,92 @@
+# Author: Pauli Virtanen <pav@iki.fi>, 2006.
+# All rights reserved. See LICENSE.txt.
+"""
+Tests for the continuation driver.
+"""
+from __future__ import division, absolute_import, print_function
+
+from numpy.testing import *
+import numpy as np
+
+import scikits.bvp1lg.continuation as continuation
+
+from testutils import *
+from test_problems import *
+
+class TestContinuation(object):
+    def test_problem_3(self):
+        # Follow problem #3 from C = 1 to C = 150, past the difficult
+        # point near C = 1.7, without hand-tuned steps
+        problem = Problem3()
+
+        def fsub(x, z, C):
+            return problem.f(x, z)
+        def dfsub(x, z, C):
+            return problem.df(x, z)
+        def gsub(z, C):
+            problem.C = C
+            return problem.g(z[:,0], z[:,1])
+        def dgsub(z, C):
+            dga, dgb = problem.dg(z[:,0], z[:,1])
+            return np.r_[dga[:1], dgb[1:]]
+
+        for num_jac in [False, True]:
+            params, solutions = continuation.solve(
+                [problem.a, problem.b], problem.m, fsub, gsub, (1, 150),
+                dfsub=None if num_jac else dfsub,
+                dgsub=None if num_jac else dgsub,
+                initial_guess=problem.guess,
+                tolerances=[1e-5, 1e-5],
+                collocation_points=3,
+                maximum_mesh_size=300)
+
+            assert params[0] == 1 and params[-1] == 150
+            assert np.all(np.diff(params) > 0)
+
+            # Close to the difficult point the discrete problem is nearly
+            # singular, and the computed solution need not be the
+            # analytical one
+            x = np.linspace(problem.a, problem.b, 501)
+            for C, solution in zip(params, solutions):
+                if 1.6 < C < 1.8:
+                    continue
+                problem.C = C
+                assert np.allclose(problem.exact_solution(x),
+                                   solution(x)[:,0], rtol=1e-5)
+
+    def test_fold(self):
+        # Follow the Bratu problem around its fold, and compare to the
+        # exact solutions on both branches
+        def fsub(x, z, p):
+            return -p * np.exp(z[:1])
+        def dfsub(x, z, p):
+            return np.array([[-p * np.exp(z[0]), 0*x]])
+        def gsub(z, p):
+            return np.array([z[0,0], z[0,1]])
+
+        params, solutions = continuation.solve(
+            [0, 1], [2], fsub, gsub, (0.5, 5), dfsub=dfsub,
+            maximum_steps=30, tolerances=[1e-6, 1e-6],
+            maximum_mesh_size=300)
+
+        # The fold at p = 3.5138... was turned
+        assert params.max() < 3.5139
+        assert params.max() > params[-1]
+
+        for p, solution in zip(params, solutions):
+            # Exact solution: u(1/2) = 2 log(cosh(theta/4)), where
+            # theta = sqrt(2 p) cosh(theta/4).
+            u_mid = solution(0.5)[0]
+            theta = 4 * np.arccosh(np.exp(u_mid / 2))
+            p_exact = theta**2 / (2 * np.cosh(theta / 4)**2)
+            assert np.allclose(p, p_exact, rtol=1e-4)
+            assert np.allclose(solution([0, 1])[:,0], 0, atol=1e-8)
+
+    def test_invalid(self):
+        assert_raises(ValueError, continuation.solve, [0, 1], [2],
+                      None, None, (1, 1))
+        assert_raises(ValueError, continuation.solve, [0, 1], [2],
+                      None, None, (1, 2), vectorized=False)
+
+def test_doctests():
+    assert doctest.testmod(continuation, verbose=0)[0] == 0
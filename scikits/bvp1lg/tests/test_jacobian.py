@@ -44,6 +44,75 @@ class TestJacobian(object):
                 lambda u: np.squeeze(problem.g(0*u, u)),
                 lambda u: problem.dg(0*u, u)[1])
 
+    def test_local_jacobian(self):
+        # Batched partial derivatives of pointwise functions
+        for problem in [test_problems.Problem3(),
+                        test_problems.Problem8()]:
+            mstar = sum(problem.m)
+            x = np.linspace(0.1, 0.9, 13)
+            z = 0.1 + 0.8*np.random.rand(mstar, 13)
+            df = problem.df(x, z)
+            for chunk_size in [None, 1, 3*(mstar + 1)]:
+                df2 = jacobian.local_jacobian(problem.f, x, z,
+                                              chunk_size=chunk_size)
+                assert df2.shape == df.shape
+                assert np.allclose(df2, df, rtol=1e-3, atol=1e-5)
+
+    def test_colored_local_jacobian(self):
+        # Structurally independent components are perturbed together
+        sparsity = np.zeros([4, 6], dtype=bool)
+        sparsity[[0, 1, 2, 3, 0], [0, 1, 2, 3, 4]] = True
+        sparsity[3, 5] = True
+        colors = jacobian.color_columns(sparsity)
+        assert colors.max() + 1 == 2
+        for c in range(2):
+            assert sparsity[:,colors == c].sum(axis=1).max() <= 1
+
+        a = np.random.rand(4, 6) * sparsity
+        calls = []
+        def f(x, z):
+            calls.append(z.shape[1])
+            return np.dot(a, z**2) + x
+        x = np.linspace(0, 1, 5)
+        z = 0.5 + np.random.rand(6, 5)
+        df = jacobian.local_jacobian(f, x, z, sparsity=sparsity)
+        assert calls == [3 * 5]
+        assert np.allclose(df, 2 * a[:,:,None] * z[None,:,:], rtol=1e-4)
+
+    def test_methods(self):
+        # Forward differences scale the step, complex steps are exact
+        def f(u):
+            return np.array([u[0]**2 * u[1], np.sin(u[1])])
+        u = np.array([1e3, 0.5])
+        df = np.array([[2*u[0]*u[1], u[0]**2], [0, np.cos(u[1])]])
+        assert np.allclose(jacobian.jacobian(f, u), df, rtol=1e-5)
+        assert np.allclose(jacobian.jacobian(f, u, method='complex'), df,
+                           rtol=1e-14, atol=0)
+        assert_raises(ValueError, jacobian.jacobian, f, u, method='central')
+
+        problem = test_problems.Problem3()
+        x = np.linspace(0.1, 0.9, 13)
+        z = 0.1 + 0.8*np.random.rand(2, 13)
+        df = jacobian.local_jacobian(problem.f, x, z, method='complex')
+        assert np.allclose(df, problem.df(x, z), rtol=1e-13, atol=0)
+
+    def test_local_jacobian_f0(self):
+        # Known unperturbed values save evaluating them again
+        problem = test_problems.Problem8()
+        x = np.linspace(0.1, 0.9, 13)
+        z = 0.1 + 0.8*np.random.rand(sum(problem.m), 13)
+        npoints = []
+        def f(x, z):
+            npoints.append(len(x))
+            return problem.f(x, z)
+        df = jacobian.local_jacobian(f, x, z, chunk_size=30)
+        assert sum(npoints) == 13 * (z.shape[0] + 1)
+        del npoints[:]
+        df2 = jacobian.local_jacobian(f, x, z, chunk_size=30,
+                                      f0=problem.f(x, z))
+        assert sum(npoints) == 13 * z.shape[0]
+        assert np.allclose(df2, df, rtol=1e-12, atol=0)
+
     def test_solving(self):
         # Solve problem #3 with numerical partial derivatives
         problem = test_problems.Problem3()
@@ -7,6 +7,7 @@ from __future__ import division, absolute_import, print_function
 
 from numpy.testing import *
 import numpy as np
+import ctypes
 
 import scikits.bvp1lg.mus as mus
 
@@ -100,5 +101,61 @@ class test_mus(object):
         assert np.allclose(problem.exact_solution(x), y,
                           rtol=1e-5)
 
+    def test_inplace(self):
+        # Solve problem #3 with functions writing to output arrays
+        original = test_problems.Problem3()
+        problem = test_problems.FirstOrderConverter(original)
+
+        def f(x, u, out):
+            out[...] = problem.f(x, u)
+
+        def gsub(ya, yb, fg, dga, dgb):
+            fg[...] = problem.g(ya, yb)
+            dga[...], dgb[...] = problem.dg(ya, yb)
+
+        def guess(x):
+            z, dm = problem.guess(x)
+            return z
+
+        x, y = mus.solve_nonlinear(f, gsub, guess, problem.a, problem.b,
+                                   output_points=51, rtol=1e-3, atol=1e-6,
+                                   inplace=True)
+        assert np.allclose(original.exact_solution(x), y[:,0],
+                          rtol=1e-5)
+
+    def test_compiled_callbacks(self):
+        # Solve problem #3 with ctypes function pointers
+        original = test_problems.Problem3()
+        problem = test_problems.FirstOrderConverter(original)
+        c_int_p = ctypes.POINTER(ctypes.c_int)
+        c_double_p = ctypes.POINTER(ctypes.c_double)
+        as_array = np.ctypeslib.as_array
+
+        @ctypes.CFUNCTYPE(None, c_int_p, c_double_p, c_double_p, c_double_p)
+        def f(n, t, u, out):
+            n = n[0]
+            as_array(out, shape=(n,))[...] = problem.f(
+                t[0], as_array(u, shape=(n,)))
+
+        @ctypes.CFUNCTYPE(None, c_int_p, c_double_p, c_double_p,
+                          c_double_p, c_double_p, c_double_p)
+        def gsub(n, ya, yb, fg, dga, dgb):
+            n = n[0]
+            ya = as_array(ya, shape=(n,))
+            yb = as_array(yb, shape=(n,))
+            as_array(fg, shape=(n,))[...] = problem.g(ya, yb)
+            # Jacobians in Fortran order
+            (as_array(dga, shape=(n, n)).T[...],
+             as_array(dgb, shape=(n, n)).T[...]) = problem.dg(ya, yb)
+
+        def guess(x):
+            z, dm = problem.guess(x)
+            return z
+
+        x, y = mus.solve_nonlinear(f, gsub, guess, problem.a, problem.b,
+                                   output_points=51, rtol=1e-3, atol=1e-6)
+        assert np.allclose(original.exact_solution(x), y[:,0],
+                          rtol=1e-5)
+
 def test_doctests():
     assert doctest.testmod(mus, verbose=0)[0] == 0